@@ -10,4 +10,13 @@ or
 >>> from fastlog import *
 
 """
-log = _log.FastLogger()
\ No newline at end of file
+log = _log.FastLogger()
+
+def getLogger(name=None):
+    """
+    Returns the fastlog logger of a subsystem, eg. getLogger('proto.tcp'), or the top-level
+    logger without a name. See ``FastLogger.getChild``
+    """
+    if not name:
+        return log
+    return log.getChild(name)
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Command line tools of fastlog
+
+    python -m fastlog view FILE [--since TIME] [--until TIME] [--level LEVEL] [--type TYPE]
+"""
+import argparse
+import sys
+
+from . import viewer
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m fastlog')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    viewer.configure(commands.add_parser('view', help='show records of an indexed log file'))
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# Bounded queues with backpressure policies for the asynchronous handlers
+import collections
+import logging
+import threading
+import time
+
+"""
+Policies deciding what happens when records are queued faster than they are handled:
+    * block - The logging thread waits until there is room in the queue
+    * drop_newest - Records are dropped while the queue is full
+    * drop_oldest - The oldest queued records make room for new ones
+    * drop_level - Above the high water mark, records below `dropLevel` are dropped.
+                   Other records wait for room like with 'block'.
+    * degrade - Above the high water mark, hexdumps are replaced by a one line summary.
+                Records still wait for room like with 'block' once the queue is full.
+"""
+BLOCK = 'block'
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+DROP_LEVEL = 'drop_level'
+DEGRADE = 'degrade'
+
+policies = (BLOCK, DROP_NEWEST, DROP_OLDEST, DROP_LEVEL, DEGRADE)
+
+class BoundedQueue(object):
+    """
+    A queue of at most `capacity` items, applying a backpressure policy once it fills up.
+
+    Every item lost to the policy is counted by reason in `stats`. ``summary`` reports the
+    losses at most every `summaryInterval` seconds, so consumers can log them.
+    """
+
+    def __init__(self, capacity=10000, policy=BLOCK, dropLevel=logging.INFO, highWater=0.75,
+                 summaryInterval=10.0):
+        if policy not in policies:
+            raise ValueError("%s is not a valid backpressure policy." % policy)
+
+        self.capacity = capacity
+        self.policy = policy
+        self.dropLevel = dropLevel
+        self.highWater = max(int(capacity * highWater), 1)
+        self.summaryInterval = summaryInterval
+
+        # Items lost by reason: 'newest', 'oldest', 'level', 'oversized' and 'degraded'
+        self.stats = collections.Counter()
+        self._reported = collections.Counter()
+        self._lastSummary = time.time()
+
+        self._reset()
+
+    def _reset(self):
+        self._queue = collections.deque()
+        # Items taken by ``get`` and not yet reported by ``done``
+        self._taken = 0
+        self._lock = threading.Lock()
+        self._notEmpty = threading.Condition(self._lock)
+        self._notFull = threading.Condition(self._lock)
+        self._closed = False
+
+    def afterFork(self):
+        """
+        Empties the queue of a forked child, with new locks. The parent handles the queued items.
+        """
+        self._reset()
+        self.stats = collections.Counter()
+        self._reported = collections.Counter()
+        self._lastSummary = time.time()
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def unfinished(self):
+        """
+        Number of items queued or taken and still being handled, see ``done``
+        """
+        with self._lock:
+            return len(self._queue) + self._taken
+
+    @property
+    def dropped(self):
+        """
+        Number of items dropped so far
+        """
+        return self.stats['newest'] + self.stats['oldest'] + self.stats['level'] + self.stats['oversized']
+
+    def lost(self, reason, count=1):
+        """
+        Counts items lost by the consumer after taking them, eg. 'oversized' records
+        """
+        with self._lock:
+            self.stats[reason] += count
+
+    def put(self, item, levelno=logging.NOTSET, degrade=None):
+        """
+        Queues an item according to the policy. Returns False if the item was dropped.
+
+        Arguments:
+            item: The item to queue
+            levelno(int): Level of the item, for the 'drop_level' policy
+            degrade(callable): Returns the summarized item, for the 'degrade' policy.
+                               None if the item can't be summarized.
+        """
+        with self._lock:
+            queue = self._queue
+            if len(queue) >= self.highWater:
+                if self.policy == DROP_LEVEL and levelno < self.dropLevel:
+                    self.stats['level'] += 1
+                    return False
+                if self.policy == DEGRADE and degrade is not None:
+                    item = degrade(item)
+                    self.stats['degraded'] += 1
+
+            while len(queue) >= self.capacity and not self._closed:
+                if self.policy == DROP_NEWEST:
+                    self.stats['newest'] += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    queue.popleft()
+                    self.stats['oldest'] += 1
+                    break
+                self._notFull.wait()
+
+            queue.append(item)
+            self._notEmpty.notify()
+            return True
+
+    def requeue(self, items):
+        """
+        Puts items taken by ``get`` back in front of the queue, as far as they fit.
+        Items which don't fit anymore are counted as dropped oldest items.
+        """
+        with self._lock:
+            room = max(self.capacity - len(self._queue), 0)
+            if room < len(items):
+                self.stats['oldest'] += len(items) - room
+                items = items[len(items) - room:]
+            self._queue.extendleft(reversed(items))
+            if items:
+                self._notEmpty.notify()
+
+    def get(self, count, timeout=None):
+        """
+        Takes up to `count` items, waiting at most `timeout` seconds for the first one.
+        Returns an empty list on timeout, or once the queue is closed and empty.
+        """
+        with self._lock:
+            if not self._queue and not self._closed:
+                self._notEmpty.wait(timeout)
+            queue = self._queue
+            items = [queue.popleft() for _ in range(min(count, len(queue)))]
+            self._taken += len(items)
+            if items:
+                self._notFull.notify_all()
+            return items
+
+    def done(self, count):
+        """
+        Reports that `count` items taken by ``get`` have been handled, or requeued
+        """
+        with self._lock:
+            self._taken -= count
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """
+        Wakes up every waiting thread. Blocked producers queue their items past the capacity.
+        """
+        with self._lock:
+            self._closed = True
+            self._notEmpty.notify_all()
+            self._notFull.notify_all()
+
+    def summary(self, force=False):
+        """
+        Returns a message describing the items lost since the last summary, or None if
+        nothing was lost or the last summary is more recent than `summaryInterval`
+        """
+        now = time.time()
+        if not force and now - self._lastSummary < self.summaryInterval:
+            return None
+
+        with self._lock:
+            stats = self.stats.copy()
+        losses = stats - self._reported
+        self._reported = stats
+        elapsed = now - self._lastSummary
+        self._lastSummary = now
+        if not losses:
+            return None
+
+        reasons = ('newest', 'oldest', 'level', 'oversized')
+        dropped = sum(losses[reason] for reason in reasons)
+        reasons = ', '.join('%s: %d' % (reason, losses[reason]) for reason in reasons if losses[reason])
+        parts = []
+        if dropped:
+            parts.append('dropped %d records (%s)' % (dropped, reasons))
+        if losses['degraded']:
+            parts.append('summarized %d hexdumps' % losses['degraded'])
+        return 'Logging fell behind, %s in the last %.1fs' % (' and '.join(parts), elapsed)
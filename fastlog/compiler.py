@@ -0,0 +1,142 @@
+# Compiles style modules into render functions
+
+from . import hexdump
+from . import tracebacks
+
+class CompiledStyle(object):
+    """
+    A style module compiled into a dispatch table of render functions.
+
+    Every message type known to the style gets its own render function, with the styled
+    prefix (and the escape sequences in it) rendered once up front. Formatting a message
+    is then a single table lookup followed by a concatenation of the indented prefix
+    and the message.
+
+    Any module providing the attributes of ``fastlog.styles.pwntools`` can be compiled.
+    """
+
+    def __init__(self, style, color=True):
+        """
+        Compiles `style`. With color=False, prefixes are rendered without their Style
+        """
+        self.style = style
+        self.color = color
+        self.indent = style.indent
+        self.nlindent = '\n' + style.indent
+
+        self.renderers = {
+            'separator': self._constant(self._styled(*style.separator)),
+            'newline':   lambda msg, indentLevel: '',
+            # the handler will take care of updating the spinner, so we will
+            # not include it here
+            'animated':  self._prefixed('', indented=False),
+            'indented':  self._prefixed(self.indent, indented=False),
+            # every line of a table is indented under the current indentation
+            'table':     self._block(self.indent),
+        }
+
+        for msgtype, (stylefunc, symb) in style.prefixes.items():
+            self.renderers.setdefault(msgtype, self._prefixed('[%s] ' % self._styled(stylefunc, symb)))
+
+        # No valid prefix was found, fallback on a default
+        self.fallback = self._prefixed('[?] ')
+
+        # Escapes around the optional timestamp column. Styles may leave it unstyled.
+        self.tsopen, self.tsclose = '', ''
+        tsstyle = getattr(style, 'timestamp', None)
+        if color and tsstyle is not None:
+            self.tsopen, self.tsclose = getattr(tsstyle, 'start', ''), getattr(tsstyle, 'reset', '')
+
+        # Escapes around the optional call site column
+        self.siteopen, self.siteclose = '', ' '
+        sitestyle = getattr(style, 'callsite', None)
+        if color and sitestyle is not None:
+            self.siteopen, self.siteclose = getattr(sitestyle, 'start', ''), getattr(sitestyle, 'reset', '') + ' '
+
+        # Escapes around the context column of bound loggers
+        self.ctxopen, self.ctxclose = '', ' '
+        ctxstyle = getattr(style, 'context', None)
+        if color and ctxstyle is not None:
+            self.ctxopen, self.ctxclose = getattr(ctxstyle, 'start', ''), getattr(ctxstyle, 'reset', '') + ' '
+
+        # Hexdump byte styles are only ever rendered with color. Uncolored formatters
+        # strip them along with any other escapes in the message.
+        self.hexbytes = hexdump._bytetable(style.hexdump)
+        self.hexmarker = hexdump._marker(style.hexdump)
+
+        # Tracebacks logged by log.exception, styled and stripped the same way
+        self.traceback = tracebacks.TracebackRenderer(getattr(style, 'traceback', None))
+
+    def _styled(self, stylefunc, symb):
+        if self.color:
+            return stylefunc(symb)
+        return symb
+
+    def _constant(self, text):
+        """
+        Builds a render function which ignores the message, eg. for separators
+        """
+        indent = self.indent
+        heads = {}
+
+        def render(msg, indentLevel):
+            try:
+                return heads[indentLevel]
+            except KeyError:
+                head = heads[indentLevel] = indent * indentLevel + text
+                return head
+        return render
+
+    def _prefixed(self, prefix, indented=True):
+        """
+        Builds a render function putting `prefix` in front of the message.
+
+        Indented prefixes are preceded by one indent per indentation level. The complete
+        prefix is built once per level and reused afterwards.
+        """
+        indent = self.indent
+        nlindent = self.nlindent
+        heads = {}
+
+        def render(msg, indentLevel):
+            try:
+                head = heads[indentLevel]
+            except KeyError:
+                head = heads[indentLevel] = (indent * indentLevel if indented else '') + prefix
+
+            # Wrap multiple lines
+            if '\n' in msg or '\r' in msg:
+                return nlindent.join((head + msg).splitlines())
+            return head + msg
+        return render
+
+    def _block(self, prefix):
+        """
+        Builds a render function putting `prefix` in front of every line of the message,
+        preceded by one indent per indentation level
+        """
+        indent = self.indent
+        heads = {}
+
+        def render(msg, indentLevel):
+            try:
+                head = heads[indentLevel]
+            except KeyError:
+                head = heads[indentLevel] = indent * indentLevel + prefix
+
+            if '\n' in msg or '\r' in msg:
+                return head + ('\n' + head).join(msg.splitlines())
+            return head + msg
+        return render
+
+    def render(self, msgtype, msg, indentLevel):
+        """
+        Renders a message of the given type and indentation level
+        """
+        return self.renderers.get(msgtype, self.fallback)(msg, indentLevel)
+
+def compile_style(style, color=True):
+    """
+    Compiles a style module. See ``CompiledStyle``
+    """
+    return CompiledStyle(style, color)
@@ -0,0 +1,239 @@
+# Runtime control of running processes: signals, a watched file or a unix socket
+import logging
+import os
+import signal
+import socket
+import stat
+import threading
+
+from .log import FastLogger
+
+# Levels stepped through by the signals, from the most verbose
+STEPS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL)
+
+"""
+Commands understood by ``Control.execute``, one per line:
+    * level [logger] LEVEL - Sets the level of the top-level logger, or of a child logger
+    * debug logger - Sets the level of a child logger to DEBUG
+    * levels - Lists the loggers and their levels
+    * stats - Lists the hexdump cache and handler statistics
+    * timings - Prints the table of log.timed() blocks, see ``FastLogger.timings``
+
+Blank lines and lines starting with '#' are ignored.
+"""
+
+class ControlError(ValueError):
+    """
+    Raised for invalid commands
+    """
+
+def _level(text):
+    if text.isdigit():
+        return int(text)
+    level = logging.getLevelName(text.upper())
+    if not isinstance(level, int):
+        raise ControlError("%s is not a valid level" % text)
+    return level
+
+class Control(object):
+    """
+    Changes the levels of a running process without a restart, through any of:
+        * Signals - SIGUSR1 makes the top-level logger more verbose, SIGUSR2 less. See ``handleSignals``
+        * A watched file of commands, applied whenever it changes. See ``watch``
+        * A local unix socket taking commands. See ``listen``
+
+    Every change of levels is applied at once, under the logger lock. Nothing is checked
+    while logging: loggers pick up the new levels through their level cache.
+
+    Example:
+
+    control = Control(log)
+    control.handleSignals()
+    control.listen('/run/worker/fastlog.sock')
+
+    $ echo "debug proto.tcp" | socat - UNIX-CONNECT:/run/worker/fastlog.sock
+    """
+
+    def __init__(self, logger=None, interval=1.0):
+        if logger is None:
+            from . import log as logger
+        self.logger = logger
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        self._socketPath = None
+
+    def _apply(self, levels):
+        """
+        Sets the levels of (logger, level) pairs, all at once
+        """
+        with self.logger._lock:
+            for logger, level in levels:
+                logger.inner.setLevel(level)
+            FastLogger._levelGeneration += 1
+
+    def _step(self, direction):
+        level = self.logger.getEffectiveLevel()
+        lower = [step for step in STEPS if step < level]
+        higher = [step for step in STEPS if step > level]
+        if direction < 0 and lower:
+            self._apply([(self.logger, lower[-1])])
+        elif direction > 0 and higher:
+            self._apply([(self.logger, higher[0])])
+
+    def handleSignals(self, verbose=getattr(signal, 'SIGUSR1', None), quiet=getattr(signal, 'SIGUSR2', None)):
+        """
+        Steps the level of the top-level logger through DEBUG, INFO, WARNING, ERROR and
+        CRITICAL on signals. Must be called from the main thread.
+        """
+        if verbose is None or quiet is None:
+            raise ControlError("Signals are not supported on this platform")
+        signal.signal(verbose, lambda signum, frame: self._step(-1))
+        signal.signal(quiet, lambda signum, frame: self._step(1))
+
+    def execute(self, text):
+        """
+        Runs commands, one per line, returning their output lines. Level changes are
+        checked first and applied together, so a file or message with an invalid command
+        changes nothing.
+        """
+        levels = []
+        actions = []
+        for line in text.splitlines():
+            words = line.split()
+            if not words or words[0].startswith('#'):
+                continue
+            command, args = words[0].lower(), words[1:]
+
+            if command == 'level' and len(args) in (1, 2):
+                logger = self.logger.getChild(args[0]) if len(args) == 2 else self.logger
+                levels.append((logger, _level(args[-1])))
+            elif command == 'debug' and len(args) == 1:
+                levels.append((self.logger.getChild(args[0]), logging.DEBUG))
+            elif command in ('levels', 'stats', 'timings') and not args:
+                actions.append(getattr(self, '_' + command))
+            else:
+                raise ControlError("Invalid command: %s" % line.strip())
+
+        if levels:
+            self._apply(levels)
+        output = []
+        for action in actions:
+            output.extend(action())
+        return output
+
+    def _levels(self):
+        return ['%s %s' % (logger.inner.name, logging.getLevelName(logger.inner.level))
+                for logger in self.logger._tree()]
+
+    def _stats(self):
+        output = []
+        for logger in self.logger._tree():
+            cache = logger._hexcache
+            if cache is not None:
+                output.append('%s hexdump cache: %d entries, %d bytes, %d hits, %d misses' % (
+                    logger.inner.name, len(cache), cache.size, cache.hits, cache.misses))
+            for handler in logger._handlers:
+                queue = getattr(handler, 'queue', None)
+                stats = getattr(queue, 'stats', None)
+                if stats is not None:
+                    output.append('%s %s: %d queued, %s' % (
+                        logger.inner.name, handler.__class__.__name__, len(queue),
+                        ', '.join('%s %d' % item for item in sorted(stats.items())) or 'nothing lost'))
+        return output
+
+    def _timings(self):
+        self.logger.timings()
+        return []
+
+    def _thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def watch(self, filename):
+        """
+        Applies the commands of a file whenever it changes, checking every `interval` seconds
+        """
+        def run():
+            last = None
+            while not self._stop.is_set():
+                try:
+                    st = os.stat(filename)
+                    current = (st.st_mtime, st.st_size)
+                except OSError:
+                    current = None
+                if current is not None and current != last:
+                    last = current
+                    try:
+                        with open(filename) as f:
+                            self.execute(f.read())
+                    except (OSError, IOError, ControlError) as e:
+                        self.logger.warning('Ignoring %s: %s', filename, e)
+                self._stop.wait(self.interval)
+        self._thread(run, 'fastlog-control-file')
+
+    def listen(self, path):
+        """
+        Takes commands on a unix socket only accessible to the current user. Every line
+        received is answered by its output lines, followed by 'ok' or 'error: ...'
+
+        A stale socket at `path` is replaced, anything else raises ControlError.
+        """
+        # Only a socket left behind by an earlier process is replaced
+        try:
+            mode = os.lstat(path).st_mode
+        except OSError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise ControlError("%s exists and is not a socket" % path)
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        server.listen(1)
+        self._server = server
+        self._socketPath = path
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                try:
+                    for line in conn.makefile('r'):
+                        try:
+                            output = self.execute(line) + ['ok']
+                        except ControlError as e:
+                            output = ['error: %s' % e]
+                        conn.sendall(('\n'.join(output) + '\n').encode('utf-8'))
+                except (OSError, IOError):
+                    pass
+                finally:
+                    conn.close()
+        self._thread(run, 'fastlog-control-socket')
+
+    def close(self):
+        """
+        Stops watching and listening
+        """
+        self._stop.set()
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            os.unlink(self._socketPath)
+            self._server = None
+        for thread in self._threads:
+            thread.join(self.interval + 1)
+        self._threads = []
@@ -0,0 +1,681 @@
+# Additional fastlog sinks
+import copy
+import errno
+import json
+import logging
+import mmap
+import os
+import socket
+import threading
+import time
+
+from . import backpressure
+from .index import IndexWriter, discard
+from .record import logRecord
+from .log import Dispatcher, _afterFork, _escapes, _renderContext
+
+class IndexedFileHandler(logging.Handler):
+    """
+    Writes records to a log file, optionally along with a sidecar index of the records.
+
+    The index stores the offset, creation time, level, type and indentation of every
+    record, so ``python -m fastlog view`` can jump to a time range or to the errors of
+    a large log without reading all of it. See ``fastlog.index``
+
+    Records are formatted by the logger's plain formatter unless another one is set.
+
+    Forked children keep writing to an unindexed file opened for appending. Otherwise,
+    or if `perProcess` is set, they move to a file of their own, see ``afterFork``
+    """
+
+    def __init__(self, filename, mode='a', encoding='utf-8', index=True, perProcess=False):
+        logging.Handler.__init__(self)
+        self.encoding = encoding
+        self.terminator = '\n'
+        self.mode = mode.replace('b', '') + 'b'
+        self.perProcess = perProcess
+        self._open(filename, index)
+
+    def _open(self, filename, index, mode=None):
+        self.baseFilename = os.path.abspath(filename)
+
+        # Binary, so the byte offsets of the records are known
+        self.stream = open(self.baseFilename, mode or self.mode)
+        self.stream.seek(0, os.SEEK_END)
+        self.offset = self.stream.tell()
+
+        # The entries of a log written from scratch are gone with it
+        self.index = None
+        if index:
+            self.index = IndexWriter(self.baseFilename, truncate=self.mode[0] in 'wx')
+
+    def afterFork(self):
+        """
+        Reopens the log in a forked child. Appending to the same file is safe without an
+        index. With an index, whose offsets would be unknown to the other processes, or
+        with `perProcess` set, the child moves to a log file of its own named after the
+        file and the process ID, eg. worker.log.1234.
+        """
+        index = self.index is not None
+        discard(self.stream)
+        if index:
+            self.index.discard()
+        if index or self.perProcess or self.mode[0] != 'a':
+            self._open('%s.%d' % (self.baseFilename, os.getpid()), index)
+        else:
+            self._open(self.baseFilename, index, 'ab')
+
+    def emit(self, record):
+        self.emitFormatted(record, self.format(record))
+
+    def emitFormatted(self, record, msg):
+        """
+        Writes a record which has already been formatted. See ``fastlog.log.Dispatcher``
+        """
+        data = (msg + self.terminator).encode(self.encoding)
+        self.acquire()
+        try:
+            self.stream.write(data)
+            if self.index is not None:
+                self.index.add(self.offset, len(data), record)
+            self.offset += len(data)
+            self.flush()
+        except Exception:
+            self.handleError(logRecord(record))
+        finally:
+            self.release()
+
+    def emitManyFormatted(self, records, msgs):
+        """
+        Writes formatted records with a single write. See ``fastlog.log.Dispatcher.handleMany``
+        """
+        self.acquire()
+        try:
+            chunks = []
+            for record, msg in zip(records, msgs):
+                data = (msg + self.terminator).encode(self.encoding)
+                if self.index is not None:
+                    self.index.add(self.offset, len(data), record)
+                self.offset += len(data)
+                chunks.append(data)
+            self.stream.write(b''.join(chunks))
+            self.flush()
+        except Exception:
+            self.handleError(logRecord(records[0]))
+        finally:
+            self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.stream and not self.stream.closed:
+                self.stream.flush()
+                if self.index is not None:
+                    self.index.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            try:
+                if self.stream and not self.stream.closed:
+                    self.stream.close()
+                if self.index is not None:
+                    self.index.close()
+            finally:
+                logging.Handler.close(self)
+        finally:
+            self.release()
+
+def _dataLength(fd):
+    """
+    Returns the length of a log file without the unused, zeroed part of its last extent
+    """
+    end = os.fstat(fd).st_size
+    while end > 0:
+        start = max(end - 65536, 0)
+        os.lseek(fd, start, os.SEEK_SET)
+        block = os.read(fd, end - start).rstrip(b'\0')
+        if block:
+            return start + len(block)
+        end = start
+    return 0
+
+class MmapFileHandler(logging.Handler):
+    """
+    Writes records to a log file through a memory mapping, without a system call per record.
+
+    The file is grown by `extent` bytes at a time, and the current extent is mapped into
+    memory. Formatted records are copied to the mapping at the write cursor. Once an extent
+    is full, the file is grown and the next extent is mapped.
+
+    On close, the file is cut down to the length of the records. Records are in the page
+    cache as soon as they are copied, so a crashed process leaves a log which is readable up
+    to the last record, followed by zeros up to the end of the extent. Reopening such a log
+    continues right after the last record.
+
+    Like ``IndexedFileHandler``, a sidecar index of the records can be written for ``python -m fastlog view``
+    """
+
+    def __init__(self, filename, extent=64 * 1024 * 1024, encoding='utf-8', index=False):
+        logging.Handler.__init__(self)
+        self.encoding = encoding
+        self.terminator = '\n'
+
+        # Mappings start on allocation granularity boundaries
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.extent = max(extent - extent % granularity, granularity)
+        self._open(filename, index)
+
+    def _open(self, filename, index):
+        self.baseFilename = os.path.abspath(filename)
+        self._fd = os.open(self.baseFilename, os.O_RDWR | os.O_CREAT, 0o644)
+        self.offset = _dataLength(self._fd)
+        self._map = None
+        self._mapStart = 0
+        self._mapEnd = 0
+
+        self.index = None
+        if index:
+            self.index = IndexWriter(self.baseFilename)
+
+    def afterFork(self):
+        """
+        Moves a forked child to a log file of its own, named after the file and the process
+        ID, eg. trace.log.1234. Processes can't share the write cursor of a mapping, so
+        the parent keeps the mapped file to itself.
+        """
+        index = self.index is not None
+        if self._map is not None:
+            self._map.close()
+        os.close(self._fd)
+        if index:
+            self.index.discard()
+        self._open('%s.%d' % (self.baseFilename, os.getpid()), index)
+
+    def _remap(self, size):
+        """
+        Maps the extent following the write cursor, with room for at least `size` bytes
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        granularity = mmap.ALLOCATIONGRANULARITY
+        start = self.offset - self.offset % granularity
+        length = max(self.extent, self.offset - start + size)
+        length += -length % granularity
+
+        # Allocate the blocks up front where possible, so a full disk fails here
+        # instead of with a SIGBUS when writing to the mapping
+        if os.fstat(self._fd).st_size < start + length:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(self._fd, start, length)
+            else:
+                os.ftruncate(self._fd, start + length)
+
+        self._map = mmap.mmap(self._fd, length, offset=start)
+        self._mapStart = start
+        self._mapEnd = start + length
+
+    def _write(self, data):
+        if self._map is None or self.offset + len(data) > self._mapEnd:
+            self._remap(len(data))
+        at = self.offset - self._mapStart
+        self._map[at:at + len(data)] = data
+        self.offset += len(data)
+
+    def emit(self, record):
+        self.emitFormatted(record, self.format(record))
+
+    def emitFormatted(self, record, msg):
+        """
+        Copies a record which has already been formatted. See ``fastlog.log.Dispatcher``
+        """
+        data = (msg + self.terminator).encode(self.encoding)
+        self.acquire()
+        try:
+            if self.index is not None:
+                self.index.add(self.offset, len(data), record)
+            self._write(data)
+        except Exception:
+            self.handleError(logRecord(record))
+        finally:
+            self.release()
+
+    def emitManyFormatted(self, records, msgs):
+        """
+        Copies formatted records at once. See ``fastlog.log.Dispatcher.handleMany``
+        """
+        self.acquire()
+        try:
+            chunks = []
+            offset = self.offset
+            for record, msg in zip(records, msgs):
+                data = (msg + self.terminator).encode(self.encoding)
+                if self.index is not None:
+                    self.index.add(offset, len(data), record)
+                offset += len(data)
+                chunks.append(data)
+            self._write(b''.join(chunks))
+        except Exception:
+            self.handleError(logRecord(records[0]))
+        finally:
+            self.release()
+
+    def flush(self):
+        """
+        Writes the mapped records to disk. Not needed for other processes to read them.
+        """
+        self.acquire()
+        try:
+            if self._map is not None:
+                self._map.flush()
+            if self.index is not None:
+                self.index.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            try:
+                if self._map is not None:
+                    self._map.flush()
+                    self._map.close()
+                    self._map = None
+                if self._fd is not None:
+                    os.ftruncate(self._fd, self.offset)
+                    os.close(self._fd)
+                    self._fd = None
+                if self.index is not None:
+                    self.index.close()
+            finally:
+                logging.Handler.close(self)
+        finally:
+            self.release()
+
+class _QueuedHandler(logging.Handler):
+    """
+    Base of the handlers which queue records on the logging thread and handle them in
+    batches on a background thread. The queue applies a backpressure policy when it
+    fills up, see ``fastlog.backpressure``. Losses are reported every `summaryInterval`
+    seconds by a warning record, handled like any other record.
+
+    Subclasses implement `prepare`, `summarize` and `process`.
+    """
+
+    threadName = 'fastlog-queue'
+
+    # Records of the native mode are queued as they are. See ``Dispatcher``
+    nativeRecords = True
+
+    def __init__(self, capacity=10000, policy=backpressure.BLOCK, dropLevel=logging.INFO,
+                 highWater=0.75, summaryInterval=10.0, batchSize=256):
+        logging.Handler.__init__(self)
+        self.queue = backpressure.BoundedQueue(capacity, policy, dropLevel, highWater, summaryInterval)
+        self.batchSize = batchSize
+
+        self._thread = None
+        self._threadLock = threading.Lock()
+        self._stop = threading.Event()
+
+    def afterFork(self):
+        """
+        Leaves the queued records to the parent, and restarts the background thread on the
+        next record. Threads don't survive a fork.
+        """
+        self.queue.afterFork()
+        self._thread = None
+        self._threadLock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def dropped(self):
+        """
+        Number of records dropped by the backpressure policy
+        """
+        return self.queue.dropped
+
+    def prepare(self, record):
+        """
+        Returns the item queued for a record. Runs on the logging thread.
+        """
+        raise NotImplementedError
+
+    def summarize(self, item):
+        """
+        Returns a one line replacement of a queued hexdump, for the 'degrade' policy
+        """
+        raise NotImplementedError
+
+    def process(self, items):
+        """
+        Handles a batch of queued items. Runs on the background thread.
+        """
+        raise NotImplementedError
+
+    def emit(self, record):
+        if self.queue.closed:
+            return
+        try:
+            item = self.prepare(record)
+        except Exception:
+            self.handleError(logRecord(record))
+            return
+
+        if self._thread is None:
+            self._start()
+
+        degrade = None
+        if getattr(record, 'fastlog-type', None) == 'indented':
+            degrade = self.summarize
+        self.queue.put(item, record.levelno, degrade)
+
+    def _start(self):
+        with self._threadLock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.threadName)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            items = self.queue.get(self.batchSize, self.queue.summaryInterval)
+            taken = len(items)
+            summary = self.queue.summary(force=self.queue.closed)
+            if summary:
+                items.append(self.prepare(_summaryRecord(summary)))
+
+            if items:
+                try:
+                    self.process(items)
+                finally:
+                    self.queue.done(taken)
+            elif self.queue.closed:
+                return
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until every queued record has been handled, at most `timeout` seconds
+        """
+        deadline = time.time() + timeout
+        while self.queue.unfinished and self._thread is not None and time.time() < deadline:
+            time.sleep(0.005)
+
+    def close(self, timeout=5.0):
+        self.queue.close()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logging.Handler.close(self)
+
+def _summaryRecord(msg):
+    """
+    Creates the warning record reporting the losses of a queue
+    """
+    return logging.makeLogRecord({
+        'name': 'fastlog',
+        'msg': msg,
+        'levelno': logging.WARNING,
+        'levelname': 'WARNING',
+        'fastlog-type': 'warning',
+        'fastlog-indent': 0,
+    })
+
+class AsyncHandler(_QueuedHandler):
+    """
+    Hands records over to other handlers on a background thread.
+
+    Any handlers may be wrapped, eg. an IndexedFileHandler, and records are formatted once
+    per formatter for all of them like with the logger's own sinks. Wrapped handlers
+    without a formatter use the formatter of the AsyncHandler.
+
+    The backpressure policy decides what happens when records are logged faster than the
+    wrapped handlers can take them, see ``fastlog.backpressure``:
+
+    >>> log.addHandler(AsyncHandler(IndexedFileHandler('trace.log'), policy='drop_level', dropLevel=log.INFO))
+    """
+
+    threadName = 'fastlog-async'
+
+    def __init__(self, *handlers, **kwargs):
+        _QueuedHandler.__init__(self, **kwargs)
+        self.handlers = list(handlers)
+        self._dispatcher = Dispatcher(self.handlers)
+
+    def afterFork(self):
+        _QueuedHandler.afterFork(self)
+        for handler in self.handlers:
+            _afterFork(handler)
+
+    def setFormatter(self, fmt):
+        old = self.formatter
+        logging.Handler.setFormatter(self, fmt)
+        for handler in self.handlers:
+            if handler.formatter is None or handler.formatter is old:
+                handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Merge the arguments now, they may change before the record is formatted
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def summarize(self, record):
+        summary = copy.copy(record)
+        summary.msg = '[hexdump of %d lines skipped]' % (record.msg.count('\n') + 1)
+        return summary
+
+    def process(self, records):
+        for record in records:
+            self._dispatcher.handle(record)
+
+    def flush(self, timeout=5.0):
+        _QueuedHandler.flush(self, timeout)
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self, timeout=5.0):
+        _QueuedHandler.close(self, timeout)
+        for handler in self.handlers:
+            handler.close()
+
+class NetworkHandler(_QueuedHandler):
+    """
+    Ships records to a log collector over a persistent TCP connection or UDP datagrams.
+
+    Records are queued by the logging thread and sent by a background thread, so logging
+    never waits on the network. Whatever has queued up while a send was in progress goes
+    out in the next send, batching up to `batchSize` records at a time. A lost connection
+    is reopened with exponential backoff. By default, if the queue grows past `capacity`
+    while the collector is unreachable, the oldest records are dropped and counted in
+    `dropped`. Other backpressure policies can be selected, see ``fastlog.backpressure``
+
+    Records are encoded as JSON lines, with the message type, indentation, call site and
+    bound context kept as separate fields instead of rendered text. Over UDP, as many lines
+    as fit in `maxDatagram` bytes are packed into each datagram.
+    """
+
+    threadName = 'fastlog-network'
+
+    # Lines may share a datagram
+    packDatagrams = True
+
+    def __init__(self, host, port, transport='tcp', timeout=5.0, backoff=(0.1, 30.0),
+                 maxDatagram=8192, **kwargs):
+        kwargs.setdefault('policy', backpressure.DROP_OLDEST)
+        _QueuedHandler.__init__(self, **kwargs)
+        if transport not in ('tcp', 'udp'):
+            raise ValueError("%s is not a valid transport, use 'tcp' or 'udp'." % transport)
+
+        self.address = (host, port)
+        self.transport = transport
+        self.timeout = timeout
+        self.backoff = backoff
+        self.maxDatagram = maxDatagram
+
+        self._sock = None
+        self._delay = backoff[0]
+
+    def afterFork(self):
+        # The connection belongs to the parent, the child opens its own
+        _QueuedHandler.afterFork(self)
+        self._disconnect()
+        self._delay = self.backoff[0]
+
+    def prepare(self, record):
+        """
+        Captures what is sent of a record on the logging thread. Encoding happens on the sender thread.
+        """
+        msg = record.getMessage()
+        if '\x1b' in msg:
+            msg = _escapes.sub('', msg)
+        return {
+            'time': record.created,
+            'level': record.levelname,
+            'levelno': record.levelno,
+            'logger': record.name,
+            'type': getattr(record, 'fastlog-type', None),
+            'indent': getattr(record, 'fastlog-indent', None) or 0,
+            'callsite': getattr(record, 'fastlog-callsite', None),
+            'context': getattr(record, 'fastlog-fields', None),
+            'msg': msg,
+        }
+
+    def summarize(self, item):
+        return dict(item, msg='[hexdump of %d lines skipped]' % (item['msg'].count('\n') + 1))
+
+    def encode(self, item):
+        """
+        Returns the bytes sent for a prepared record
+        """
+        return json.dumps(item, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+
+    def process(self, items):
+        try:
+            self._send([self.encode(item) for item in items])
+            self._delay = self.backoff[0]
+        except Exception:
+            self._disconnect()
+            if self.queue.closed:
+                return
+
+            # Put the batch back in front of newer records, as far as it still fits
+            self.queue.requeue(items)
+
+            # New records don't cut the backoff short, only closing the handler does
+            self._stop.wait(self._delay)
+            self._delay = min(self._delay * 2, self.backoff[1])
+
+    def _connect(self):
+        if self.transport == 'tcp':
+            self._sock = socket.create_connection(self.address, self.timeout)
+        else:
+            family, kind, proto, _, address = socket.getaddrinfo(
+                self.address[0], self.address[1], 0, socket.SOCK_DGRAM)[0]
+            self._sock = socket.socket(family, kind, proto)
+            self._sock.connect(address)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _send(self, frames):
+        if self._sock is None:
+            self._connect()
+
+        if self.transport == 'tcp':
+            self._sock.sendall(b''.join(frames))
+            return
+
+        if not self.packDatagrams:
+            for frame in frames:
+                self._sendDatagram([frame])
+            return
+
+        datagram = []
+        size = 0
+        for frame in frames:
+            if datagram and size + len(frame) > self.maxDatagram:
+                self._sendDatagram(datagram)
+                datagram, size = [], 0
+            datagram.append(frame)
+            size += len(frame)
+        if datagram:
+            self._sendDatagram(datagram)
+
+    def _sendDatagram(self, frames):
+        """
+        Sends frames as one datagram. Frames too large for a datagram of their own are
+        dropped and counted as 'oversized', retrying them would never succeed.
+        """
+        try:
+            self._sock.send(b''.join(frames))
+        except socket.error as e:
+            if e.errno != errno.EMSGSIZE:
+                raise
+            if len(frames) == 1:
+                self.queue.lost('oversized')
+                return
+            for frame in frames:
+                self._sendDatagram([frame])
+
+    def close(self, timeout=None):
+        _QueuedHandler.close(self, self.timeout if timeout is None else timeout)
+        self._disconnect()
+
+class SyslogHandler(NetworkHandler):
+    """
+    Ships records to a syslog collector as RFC 5424 messages.
+
+    The message type, indentation, call site and bound context are sent as structured data.
+    Over TCP, messages are framed by octet counting (RFC 6587). Over UDP, every message is
+    sent in its own datagram.
+    """
+
+    packDatagrams = False
+
+    # Structured data ID of the fastlog fields
+    sdid = 'fastlog@32473'
+
+    def __init__(self, host='localhost', port=514, transport='udp', facility=1, appname='fastlog', **kwargs):
+        NetworkHandler.__init__(self, host, port, transport, **kwargs)
+        self.facility = facility
+        self.appname = appname
+        self.hostname = socket.gethostname() or '-'
+        self.procid = str(os.getpid())
+
+    def afterFork(self):
+        NetworkHandler.afterFork(self)
+        self.procid = str(os.getpid())
+
+    def encode(self, item):
+        severity = 7 if item['levelno'] < logging.INFO else \
+            6 if item['levelno'] < logging.WARNING else \
+            4 if item['levelno'] < logging.ERROR else \
+            3 if item['levelno'] < logging.CRITICAL else 2
+
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(item['time'])) + '.%06dZ' % (item['time'] % 1 * 1e6)
+        params = ' '.join('%s="%s"' % (k, _sdescape(item[k]))
+                          for k in ('type', 'indent', 'callsite') if item[k] is not None)
+        if item['context']:
+            params += ' context="%s"' % _sdescape(_renderContext(item['context']))
+        sd = '[%s %s]' % (self.sdid, params) if params else '-'
+
+        msg = ('<%d>1 %s %s %s %s - %s %s' % (self.facility * 8 + severity, stamp, self.hostname,
+                                              self.appname, self.procid, sd, item['msg'])).encode('utf-8')
+        if self.transport == 'tcp':
+            return str(len(msg)).encode('ascii') + b' ' + msg
+        return msg
+
+def _sdescape(value):
+    """
+    Escapes a structured data parameter value, see RFC 5424 section 6.3.3
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(']', '\\]')
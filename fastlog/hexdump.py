@@ -1,31 +1,101 @@
 # -*- coding: utf-8 -*-
 # From pwntool's pwnlib, modified for py3 and fastlog
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
-
+import collections
+import hashlib
+import re
 import string
 import struct
+import sys
+import threading
 import six
 
-def _flat(args):
-    out = []
+def _encode(text):
+    """
+    Encodes text so that every character maps onto one byte where possible.
+
+    Characters below 256 are treated as raw byte values (the Python 2 'str' behaviour),
+    anything wider falls back to UTF-8.
+    """
+    try:
+        return text.encode('latin-1')
+    except UnicodeEncodeError:
+        return text.encode('utf8')
+
+def _byteview(view):
+    """
+    Returns a one dimensional, unsigned byte view of a memoryview.
+
+    Contiguous buffers are cast in place, only strided buffers have to be copied.
+    """
+    if six.PY2:
+        # No casting on Python 2, a bytearray gives us integer iteration instead
+        return bytearray(view.tobytes())
+    if not view.c_contiguous:
+        return memoryview(view.tobytes())
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+def _flatparts(args):
     for arg in args:
         if isinstance(arg, (list, tuple)):
-            out.append(_flat(arg))
-        elif isinstance(arg, str):
-            out.append(arg)
-        elif isinstance(arg, unicode):
-            out.append(arg.encode('utf8'))
+            for part in _flatparts(arg):
+                yield part
+        elif isinstance(arg, six.text_type):
+            yield _encode(arg)
         # Not supporting integer packing for now
         #elif isinstance(arg, (int, long)):
             #out.append(struct.pack("<Larg))
-        elif isinstance(arg, bytearray):
-            out.append(str(arg))
         else:
-            raise ValueError("flat(): Flat does not support values of type %s" % type(arg))
-    return ''.join(out)
+            try:
+                yield _byteview(memoryview(arg)).tobytes()
+            except TypeError:
+                raise ValueError("flat(): Flat does not support values of type %s" % type(arg))
+
+def _flat(args):
+    """
+    Returns a flat byte view over the data passed in.
+
+    Any object supporting the buffer protocol (bytes, bytearray, memoryview, array.array,
+    mmap, numpy arrays, ...) is viewed in place without copying. Text is encoded with `_encode`.
+
+    Lists and tuples are still flattened for older callers, which costs a single copy.
+    """
+    if isinstance(args, six.text_type):
+        return _byteview(memoryview(_encode(args)))
+    if isinstance(args, (list, tuple)):
+        return _byteview(memoryview(b''.join(_flatparts(args))))
+    try:
+        view = memoryview(args)
+    except TypeError:
+        raise ValueError("flat(): Flat does not support values of type %s" % type(args))
+    return _byteview(view)
+
+def _readchunks(fd, width):
+    """
+    Reads a file-like object `width` bytes at a time, yielding byte views of each chunk
+    """
+    while True:
+        # If a tube is passed in as fd, it will raise EOFError when it runs
+        # out of data, unlike a file or StringIO object, which return an empty
+        # string.
+        try:
+            chunk = fd.read(width)
+        except EOFError:
+            return
+
+        # We have run out of data, exit the loop
+        if not chunk:
+            return
+
+        yield _flat(chunk)
+
+def _chunks(data, width):
+    """
+    Yields `width` sized slices of a flat byte view. Slicing a memoryview does not copy.
+    """
+    for i in range(0, len(data), width):
+        yield data[i:i + width]
 
 def isprint(c):
     """isprint(c) -> bool
@@ -33,16 +103,133 @@ def isprint(c):
     Return True if a character is printable"""
     return c in string.ascii_letters + string.digits + string.punctuation + ' '
 
+_HEXII = bytearray((string.punctuation + string.digits + string.ascii_lowercase + string.ascii_uppercase).encode('ascii'))
+
 def _hexiichar(c):
-    HEXII = string.punctuation + string.digits + string.ascii_lowercase + string.ascii_uppercase
-    if c in HEXII:
+    if c in _HEXII:
         return ".%c " % c
-    elif c == '\0':
+    elif c == 0x00:
         return "   "
-    elif c == '\xff':
+    elif c == 0xff:
         return "## "
     else:
-        return "%02x " % ord(c)
+        return "%02x " % c
+
+def _marker(style):
+    """
+    Returns the styled column marker of a hexdump style dictionary
+    """
+    return (style.get('marker') or (lambda s:s))('│')
+
+def _bytetable(style):
+    """
+    Renders every byte value with a hexdump style dictionary.
+
+    Returns a list indexed by byte value of (hex, printable) tuples.
+    """
+    def style_byte(b):
+        hbyte = '%02x' % ord(b)
+        abyte = b if isprint(b) else '·'
+        if hbyte in style:
+            st = style[hbyte]
+        elif isprint(b):
+            st = style.get('printable')
+        else:
+            st = style.get('nonprintable')
+        if st:
+            hbyte = st(hbyte)
+            abyte = st(abyte)
+        return hbyte, abyte
+    return [style_byte(chr(b)) for b in range(256)]
+
+class _Highlights(object):
+    """
+    Byte ranges to highlight in a hexdump, looked up one row at a time.
+
+    Patterns are searched with a single regular expression. With the whole buffer at hand,
+    it is searched once up front. File objects are searched row by row with ``search``, as
+    far ahead of the rendered row as the longest pattern, carrying over enough bytes to find
+    the patterns crossing rows. Either way each row only looks at the ranges
+    overlapping it, so the cost grows with the number of matches, not with the number of
+    patterns times the size of the data.
+
+    Ranges are (start, end, style) tuples with offsets into the data. A style of None
+    stands for the 'highlight' style.
+    """
+
+    def __init__(self, patterns, ranges, data=None):
+        self.ranges = sorted(ranges)
+        self.matches = []
+        self.regex = None
+        self.carry = b''
+        self.tail = 0
+        self.matched = 0
+        self._first = [0, 0]
+
+        if patterns:
+            # Longer patterns first, so they win over their own prefixes
+            patterns = sorted(set(patterns), key=len, reverse=True)
+            self.regex = re.compile(b'|'.join(re.escape(p) for p in patterns))
+            self.tail = len(patterns[0]) - 1
+
+        if data is not None and self.regex is not None:
+            self.matches = [(m.start(), m.end(), None) for m in self.regex.finditer(data)]
+            self.regex = None
+
+    def search(self, start, chunk):
+        """
+        Searches the patterns in the next row of streamed data
+        """
+        window = self.carry + bytes(chunk)
+        base = start - len(self.carry)
+        for m in self.regex.finditer(window):
+            mstart, mend = base + m.start(), base + m.end()
+
+            # Matches within the carried bytes were found with the previous row
+            if mend > start and mstart >= self.matched:
+                self.matches.append((mstart, mend, None))
+                self.matched = mend
+        self.carry = window[max(len(window) - self.tail, 0):] if self.tail else b''
+
+        # Forget the matches behind us
+        if self._first[1] > 1024:
+            del self.matches[:self._first[1]]
+            self._first[1] = 0
+
+    def row(self, start, chunk):
+        """
+        Returns the (start, end, style) ranges to highlight in a row, relative to the row
+        """
+        end = start + len(chunk)
+        found = []
+        for n, spans in enumerate((self.ranges, self.matches)):
+            # Skip the ranges ending before this row, they won't be needed again
+            i = self._first[n]
+            while i < len(spans) and spans[i][1] <= start:
+                i += 1
+            self._first[n] = i
+
+            while i < len(spans) and spans[i][0] < end:
+                sstart, send, st = spans[i]
+                if send > start:
+                    found.append((max(sstart, start) - start, min(send, end) - start, st))
+                i += 1
+        return found
+
+def _lookahead(chunks, highlights, rows):
+    """
+    Yields the rows of streamed data once the patterns `rows` rows ahead of them have been searched
+    """
+    pending = collections.deque()
+    start = 0
+    for chunk in chunks:
+        highlights.search(start, chunk)
+        start += len(chunk)
+        pending.append(chunk)
+        if len(pending) > rows:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
 
 def hexdump_iter(logger, fd, width=16, skip=True, hexii=False, begin=0, highlight=None):
     r"""
@@ -51,76 +238,97 @@ def hexdump_iter(logger, fd, width=16, skip=True, hexii=False, begin=0, highligh
 
     Arguments:
         logger(FastLogger): Logger object
-        fd(file): File object to dump.  Use :meth:`StringIO.StringIO` or :meth:`hexdump` to dump a string.
+        fd(file): Data to dump. Either a file object, or any object supporting the buffer protocol
+                  (bytes, bytearray, memoryview, array.array, mmap, numpy arrays, ...)
         width(int): The number of characters per line
         skip(bool): Set to True, if repeated lines should be replaced by a "*"
         hexii(bool): Set to True, if a hexii-dump should be returned instead of a hexdump.
         begin(int):  Offset of the first byte to print in the left column
-        highlight(iterable): Byte values to highlight.
+        highlight(iterable): What to highlight. Either byte values, byte patterns (bytes or text
+                             of more than one character) or (offset, length[, style]) ranges,
+                             with offsets into the data and an optional style callable.
+                             Hexii dumps are not highlighted.
 
     Returns:
         A generator producing the hexdump-dump one line at a time.
     """
-    style     = logger.style.hexdump.copy()
-    highlight = highlight or []
+    style     = logger.style.hexdump
+    compiled  = getattr(logger, 'compiled', None)
+
+    highlights = None
+    if highlight:
+        values, patterns, ranges = [], [], []
+        for h in highlight:
+            if isinstance(h, tuple):
+                offset, length, st = h if len(h) == 3 else h + (None,)
+                ranges.append((offset, offset + length, st))
+            elif isinstance(h, six.integer_types):
+                values.append(h)
+            elif len(h) == 1:
+                values.append(ord(h))
+            elif isinstance(h, six.text_type):
+                patterns.append(_encode(h))
+            else:
+                patterns.append(bytes(h))
 
-    for b in highlight:
-        if isinstance(b, str):
-            b = ord(b)
-        style['%02x' % b] = style['highlight']
+        if values:
+            style = style.copy()
+            for b in values:
+                style['%02x' % b] = style['highlight']
 
-    _style = style
+            # Highlights change the per-byte styles, so the precompiled table can't be used
+            compiled = None
+
+        if patterns or ranges:
+            if not hasattr(fd, 'read'):
+                fd = _flat(fd)
+                highlights = _Highlights(patterns, ranges, fd)
+            else:
+                highlights = _Highlights(patterns, ranges)
+
+            # One table of bytes per highlight style
+            tables = {}
+            def highlighted(st):
+                try:
+                    return tables[st]
+                except KeyError:
+                    st = st or style['highlight']
+                    table = tables[st] = _bytetable({'printable': st, 'nonprintable': st})
+                    return table
 
     skipping    = False
-    lines       = []
-    last_unique = ''
+    last_unique = None
     byte_width  = len('00 ')
     column_sep  = '  '
     line_fmt    = '%%(offset)08x  %%(hexbytes)-%is │%%(printable)s│' % (len(column_sep)+(width*byte_width))
     spacer      = ' '
-    marker      = (style.get('marker') or (lambda s:s))('│')
+    marker      = compiled.hexmarker if compiled else _marker(style)
 
     if hexii:
         column_sep = ''
         line_fmt   = '%%(offset)08x  %%(hexbytes)-%is│' % (len(column_sep)+(width*byte_width))
     else:
-        def style_byte(b):
-            hbyte = '%02x' % ord(b)
-            abyte = b if isprint(b) else '·'
-            if hbyte in style:
-                st = style[hbyte]
-            elif isprint(b):
-                st = style.get('printable')
-            else:
-                st = style.get('nonprintable')
-            if st:
-                hbyte = st(hbyte)
-                abyte = st(abyte)
-            return hbyte, abyte
-        cache = [style_byte(chr(b)) for b in range(256)]
+        cache = compiled.hexbytes if compiled else _bytetable(style)
+
+    # Buffers are sliced in place, file objects are read one row at a time
+    if hasattr(fd, 'read'):
+        chunks = _readchunks(fd, width)
+    else:
+        chunks = _chunks(_flat(fd), width)
+    if highlights is not None and highlights.regex is not None:
+        chunks = _lookahead(chunks, highlights, -(-highlights.tail // width))
 
     numb = 0
-    while True:
+    for chunk in chunks:
         offset = begin + numb
-
-        # If a tube is passed in as fd, it will raise EOFError when it runs
-        # out of data, unlike a file or StringIO object, which return an empty
-        # string.
-        try:
-            chunk = fd.read(width)
-        except EOFError:
-            chunk = ''
-
-        # We have run out of data, exit the loop
-        if chunk == '':
-            break
+        spans = highlights.row(numb, chunk) if highlights else None
 
         # Advance the cursor by the number of bytes we actually read
         numb += len(chunk)
 
         # If this chunk is the same as the last unique chunk,
-        # use a '*' instead.
-        if skip and last_unique:
+        # use a '*' instead. Highlighted rows are always shown.
+        if skip and last_unique is not None and not spans:
             same_as_last_line = (last_unique == chunk)
             lines_are_sequential = False
             last_unique = chunk
@@ -139,12 +347,19 @@ def hexdump_iter(logger, fd, width=16, skip=True, hexii=False, begin=0, highligh
         skipping = False
         last_unique = chunk
 
+        # Byte tables of the highlighted row
+        rowtables = None
+        if spans and not hexii:
+            rowtables = [cache] * len(chunk)
+            for start, end, st in spans:
+                rowtables[start:end] = [highlighted(st)] * (end - start)
+
         # Generate contents for line
         hexbytes = ''
         printable = ''
         for i, b in enumerate(chunk):
             if not hexii:
-                hbyte, abyte = cache[ord(b)]
+                hbyte, abyte = (rowtables[i] if rowtables else cache)[b]
             else:
                 hbyte, abyte = _hexiichar(b), ''
 
@@ -180,18 +395,102 @@ def hexdump_iter(logger, fd, width=16, skip=True, hexii=False, begin=0, highligh
     line = "%08x" % (begin + numb)
     yield line
 
+# Fast hash of dumped data, blake2b where available
+if hasattr(hashlib, 'blake2b'):
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+else:
+    def _digest(data):
+        return hashlib.md5(data).digest()
+
+class HexdumpCache(object):
+    """
+    A least recently used cache of rendered hexdumps, bounded by the memory used by the
+    renderings. Keyed on a hash of the data and the hexdump arguments. See ``FastLogger.setHexdumpCache``
+
+    The style isn't part of the key, the cache must be cleared when the style changes.
+    """
+
+    # Estimated memory used by an entry besides its rendering
+    overhead = 200
+
+    def __init__(self, maxBytes=16 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, data, args):
+        """
+        Returns the key of a dump of a flat byte view with the given hexdump arguments,
+        or None if the arguments can't be part of a key. An iterable `highlight` must be
+        turned into a tuple first, it is read here.
+        """
+        args = dict(args)
+        if args.get('highlight') is not None:
+            args['highlight'] = tuple(args['highlight'])
+        args = tuple(sorted(args.items()))
+        try:
+            hash(args)
+        except TypeError:
+            return None
+        return _digest(data), len(data), args
+
+    def get(self, key):
+        """
+        Returns a cached rendering, or None
+        """
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.pop(key)
+            self._entries[key] = text
+            return text
+
+    def put(self, key, text):
+        """
+        Caches a rendering, evicting the least recently used ones as needed. Renderings
+        larger than the whole cache are not kept.
+        """
+        size = sys.getsizeof(text) + self.overhead
+        if size > self.maxBytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= sys.getsizeof(old) + self.overhead
+            self._entries[key] = text
+            self.size += size
+            while self.size > self.maxBytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sys.getsizeof(evicted) + self.overhead
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
 def hexdump(logger, s, width=16, skip=True, hexii=False, begin=0, highlight=None):
     r"""
     Return a hexdump-dump of a string.
 
     Arguments:
         logger(FastLogger): Logger object
-        s(str): The data to hexdump.
+        s(buffer): The data to hexdump. Any buffer protocol object, text, or a list of those.
         width(int): The number of characters per line
         skip(bool): Set to True, if repeated lines should be replaced by a "*"
         hexii(bool): Set to True, if a hexii-dump should be returned instead of a hexdump.
         begin(int):  Offset of the first byte to print in the left column
-        highlight(iterable): Byte values to highlight.
+        highlight(iterable): Byte values, byte patterns or (offset, length, style) ranges to
+                             highlight. See :meth:`hexdump_iter`.
 
     Returns:
         A hexdump-dump in the form of a string.
@@ -305,8 +604,7 @@ def hexdump(logger, s, width=16, skip=True, hexii=False, begin=0, highlight=None
         0000000f  41                                               │A│
         00000010
     """
-    s = _flat(s)
-    return '\n'.join(hexdump_iter(logger, StringIO(s),
+    return '\n'.join(hexdump_iter(logger, _flat(s),
                                   width,
                                   skip,
                                   hexii,
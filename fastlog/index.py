@@ -0,0 +1,250 @@
+# Sidecar indexes for fastlog log files
+import logging
+import os
+import struct
+
+"""
+Message types with a fixed code in the index. New types must only ever be appended.
+Types missing from this list are stored as `UNKNOWN`.
+"""
+TYPES = (
+    'info', 'debug', 'warning', 'critical', 'error', 'success', 'failure',
+    'exception', 'status', 'info_once', 'warning_once', 'animated',
+    'separator', 'newline', 'indented', 'table',
+)
+UNKNOWN = 255
+
+_typecodes = dict((t, i) for i, t in enumerate(TYPES))
+
+# One entry per record: offset, length, created, level, type code, indent
+ENTRY = struct.Struct('<QIdBBH')
+
+# One summary per bucket of entries: first entry, entry count, first and last creation
+# time, mask of level ranges, mask of type codes
+BUCKET = struct.Struct('<QIddBI')
+
+# Entries summarized per bucket
+BUCKET_SIZE = 4096
+
+def typecode(msgtype):
+    """
+    Returns the index code of a message type
+    """
+    return _typecodes.get(msgtype, UNKNOWN)
+
+def typename(code):
+    """
+    Returns the message type of an index code, or None if the type is unknown
+    """
+    if code < len(TYPES):
+        return TYPES[code]
+    return None
+
+def levelbit(levelno):
+    """
+    Returns the bucket level mask bit of a level. Each bit covers 10 levels, eg. ERROR to CRITICAL-1
+    """
+    return 1 << min(levelno // 10, 7)
+
+def typebit(code):
+    """
+    Returns the bucket type mask bit of a type code. Unknown types share the last bit.
+    """
+    return 1 << min(code, 31)
+
+def paths(filename):
+    """
+    Returns the (entries, buckets) sidecar paths of a log file
+    """
+    return filename + '.idx', filename + '.bkt'
+
+def discard(f):
+    """
+    Closes a file inherited from the parent process after a fork, dropping the data buffered
+    by the parent instead of writing it a second time
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, f.fileno())
+    finally:
+        os.close(devnull)
+    f.close()
+
+def unpack(fmt, data):
+    """
+    Yields the tuples of a buffer of packed structures, like ``struct.Struct.iter_unpack``
+    which Python 2 lacks
+    """
+    for offset in range(0, len(data) - fmt.size + 1, fmt.size):
+        yield fmt.unpack_from(data, offset)
+
+class IndexWriter(object):
+    """
+    Appends entries for the records of a log file to its sidecar index.
+
+    Every record gets a fixed size entry in the `.idx` file. Once `BUCKET_SIZE` entries
+    have been written, a summary of them (time range, levels and types present) is
+    appended to the `.bkt` file. Readers use the summaries to skip whole buckets.
+    """
+
+    def __init__(self, filename, truncate=False):
+        """
+        Arguments:
+            truncate(bool): Start a new index, for a log file written from scratch
+        """
+        self.entryPath, self.bucketPath = paths(filename)
+        mode = 'wb' if truncate else 'ab'
+        self.entries = open(self.entryPath, mode)
+        self.buckets = open(self.bucketPath, mode)
+
+        # Drop partially written entries and summaries left behind by a crash
+        for f, size in ((self.entries, ENTRY.size), (self.buckets, BUCKET.size)):
+            f.seek(0, os.SEEK_END)
+            f.truncate(f.tell() - f.tell() % size)
+            f.seek(0, os.SEEK_END)
+
+        # Continue an existing index, rebuilding the summary of its last, partial bucket
+        self.count = self.entries.tell() // ENTRY.size
+        self.bucketStart = (self.buckets.tell() // BUCKET.size) * BUCKET_SIZE
+        self._reset()
+        if self.bucketStart < self.count:
+            with open(self.entryPath, 'rb') as f:
+                f.seek(self.bucketStart * ENTRY.size)
+                for entry in unpack(ENTRY, f.read((self.count - self.bucketStart) * ENTRY.size)):
+                    self._summarize(entry[2], entry[3], entry[4])
+
+    def _reset(self):
+        self.tmin = None
+        self.tmax = None
+        self.levels = 0
+        self.types = 0
+
+    def _summarize(self, created, levelno, code):
+        if self.tmin is None or created < self.tmin:
+            self.tmin = created
+        if self.tmax is None or created > self.tmax:
+            self.tmax = created
+        self.levels |= levelbit(levelno)
+        self.types |= typebit(code)
+
+    def add(self, offset, length, record):
+        """
+        Adds the entry of a record written at `offset` with a length of `length` bytes
+        """
+        code = typecode(getattr(record, 'fastlog-type', None))
+        levelno = min(record.levelno, 255)
+        indent = min(getattr(record, 'fastlog-indent', None) or 0, 0xffff)
+
+        self.entries.write(ENTRY.pack(offset, length, record.created, levelno, code, indent))
+        self.count += 1
+        self._summarize(record.created, levelno, code)
+
+        if self.count - self.bucketStart >= BUCKET_SIZE:
+            self._writeBucket()
+
+    def _writeBucket(self):
+        # Entries are flushed first, so a summary never refers to entries that are missing
+        self.entries.flush()
+        self.buckets.write(BUCKET.pack(self.bucketStart, self.count - self.bucketStart,
+                                       self.tmin, self.tmax, self.levels, self.types))
+        self.buckets.flush()
+        self.bucketStart = self.count
+        self._reset()
+
+    def flush(self):
+        self.entries.flush()
+        self.buckets.flush()
+
+    def close(self):
+        self.entries.close()
+        self.buckets.close()
+
+    def discard(self):
+        """
+        Closes the index in a forked child, leaving the buffered entries to the parent
+        """
+        discard(self.entries)
+        discard(self.buckets)
+
+class IndexReader(object):
+    """
+    Looks up records in a log file using its sidecar index. See ``IndexWriter``
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entryPath, self.bucketPath = paths(filename)
+        self.logSize = os.path.getsize(filename)
+        self.entryCount = os.path.getsize(self.entryPath) // ENTRY.size
+
+        self.buckets = []
+        if os.path.exists(self.bucketPath):
+            with open(self.bucketPath, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % BUCKET.size
+            self.buckets = [b for b in unpack(BUCKET, data[:usable])
+                            if b[0] + b[1] <= self.entryCount]
+
+    def _ranges(self, since, until, minlevel, types):
+        """
+        Yields the (first, count) entry ranges of the buckets which may contain matches
+        """
+        levelmask = 0
+        for bit in range(min(minlevel // 10, 7), 8):
+            levelmask |= 1 << bit
+        typemask = None
+        if types is not None:
+            typemask = 0
+            for code in types:
+                typemask |= typebit(code)
+
+        end = 0
+        for first, count, tmin, tmax, levels, typebits in self.buckets:
+            end = first + count
+            if since is not None and tmax < since:
+                continue
+            if until is not None and tmin > until:
+                continue
+            if not levels & levelmask:
+                continue
+            if typemask is not None and not typebits & typemask:
+                continue
+            yield first, count
+
+        # Entries of the last bucket have no summary yet
+        if end < self.entryCount:
+            yield end, self.entryCount - end
+
+    def find(self, since=None, until=None, minlevel=logging.NOTSET, types=None):
+        """
+        Yields the (offset, length, created, levelno, type code, indent) entries of
+        matching records, in the order they were written.
+
+        Arguments:
+            since(float): Skip records created before this time
+            until(float): Skip records created after this time
+            minlevel(int): Skip records below this level
+            types(iterable): Only return records with these type codes
+        """
+        if types is not None:
+            types = frozenset(types)
+
+        with open(self.entryPath, 'rb') as f:
+            for first, count in self._ranges(since, until, minlevel, types):
+                f.seek(first * ENTRY.size)
+                data = f.read(count * ENTRY.size)
+                data = data[:len(data) - len(data) % ENTRY.size]
+                for entry in unpack(ENTRY, data):
+                    offset, length, created, levelno, code, indent = entry
+                    if since is not None and created < since:
+                        continue
+                    if until is not None and created > until:
+                        continue
+                    if levelno < minlevel:
+                        continue
+                    if types is not None and code not in types:
+                        continue
+                    # A crash may leave entries for data which never made it to the file
+                    if offset + length > self.logSize:
+                        return
+                    yield entry
@@ -1,25 +1,96 @@
 import logging
+import os
+import functools
 import importlib
+import itertools
+import numbers
+import re
 import sys
+import threading
 import six
 from . import hexdump
+from . import compiler
+from . import timestamp
+from .record import Record, logRecord
+from . import timing
+from . import tracebacks
 class FastLogger:
     """
     fastlog provides a simple, clean logging interface for your Python scripts
     """
 
-    def __init__(self):
-        # Only one top-level logger, for simplicity
-        self.inner = logging.getLogger("fastlog")
-        
-        # Setup in setStyle
+    # Bound key/value context as (rendered fragment, fields), or None. See bind
+    _context = None
+
+    # Bumped by every level change, telling loggers to recompute their effective level
+    _levelGeneration = 0
+
+    def __init__(self, name=None, parent=None):
+        """
+        Creates the top-level logger, or with a name and parent, a child logger. See ``getChild``
+        """
+        self.name = name
+        self._parent = parent
+        self._children = {}
+        self.inner = logging.getLogger("fastlog.%s" % name if name else "fastlog")
+
+        # Every sink, fed by a single dispatcher on the inner logger
         self._handlers = []
+        self._dispatcher = Dispatcher(self._handlers)
+        self.inner.addHandler(self._dispatcher)
+
+        # The stdout handler. Setup in setStyle
+        self._console = None
+
+        # Held while records are passed to the inner logger, so multi-record output
+        # such as streamed hexdumps is never interleaved with other threads.
+        # Shared by the whole tree of loggers.
+        self._lock = parent._lock if parent is not None else threading.RLock()
+
+        # Effective level, recomputed when the level of any logger changes. See isEnabledFor
+        self._effectiveLevel = logging.NOTSET
+        self._levelSeen = -1
+
+        # Records go through the stdlib Logger unless in native mode. See setMode
+        self._native = False
 
-        # Default style
-        self.setStyle("fastlog.styles.pwntools")
+        # Records collected per thread by batch blocks, and the number of active batches
+        self._batch = threading.local()
+        self._batching = 0
 
-        # Default level
-        self.setLevel(logging.INFO)
+        # Call site annotations, off by default. See setCallsite
+        self._callsite = False
+        self._site = None
+
+        # Aggregates of timed blocks. See timed
+        self._timings = timing.Timings()
+
+        # Rendered hexdumps, not cached by default. See setHexdumpCache
+        self._hexcache = None
+
+        # Run in forked children. See onFork
+        self._forkCallbacks = []
+        if parent is None and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self._beforeFork, after_in_parent=self._afterForkParent,
+                                after_in_child=self._afterForkChild)
+
+        # Timestamp column, off by default. See setTimestamp
+        self._timestamp = None
+        self._start = timestamp.monotonic()
+
+        if parent is None:
+            # Default style
+            self.setStyle("fastlog.styles.pwntools")
+
+            # Default level
+            self.setLevel(logging.INFO)
+        else:
+            # Children start out like their parent, and inherit its level
+            self.setStyle(parent.style.__name__)
+            if parent._timestamp:
+                self.setTimestamp(*parent._timestamp)
+            self.setCallsite(parent._callsite)
+            self._native = parent._native
 
         # Initial no indent
         self._indent = 0
@@ -39,9 +110,20 @@ class FastLogger:
         """
         Setups a new internal logging handler. For fastlog loggers,
         handlers are kept track of in the self._handlers list
+
+        Handlers without a formatter share the logger's plain (uncolored) formatter, so
+        every such sink reuses the same rendering of a record. See ``Dispatcher``
         """
+        if handler.formatter is None:
+            handler.setFormatter(self.plainFormatter)
         self._handlers.append(handler)
-        self.inner.addHandler(handler)
+
+    def removeHandler(self, handler):
+        """
+        Removes a handler previously added with ``addHandler``
+        """
+        if handler in self._handlers:
+            self._handlers.remove(handler)
     
     def setStyle(self, stylename):
         """
@@ -52,30 +134,408 @@ class FastLogger:
         Available styles can be found under /fastlog/styles/
 
         The default style is 'fastlog.styles.pwntools'
+
+        The style module is compiled into the logger's formatters, see ``fastlog.compiler``
         """
         self.style = importlib.import_module(stylename)
-        newHandler = Handler()
-        newHandler.setFormatter(Formatter(self.style))
-        self.addHandler(newHandler)
+
+        old = (getattr(self, 'formatter', None), getattr(self, 'plainFormatter', None))
+        self.formatter = Formatter(self.style)
+        self.plainFormatter = Formatter(self.style, color=False)
+        if self._timestamp:
+            self.setTimestamp(*self._timestamp)
+        self.compiled = self.formatter.compiled
+
+        # Cached hexdumps were rendered with the old style
+        if self._hexcache is not None:
+            self._hexcache.clear()
+
+        # Sinks sharing the old formatters follow the new style
+        for handler in self._handlers:
+            if handler.formatter is old[0]:
+                handler.setFormatter(self.formatter)
+            elif handler.formatter is old[1]:
+                handler.setFormatter(self.plainFormatter)
+
+        # Only the top-level logger prints to the console, children propagate to it
+        if self._console is None and self._parent is None:
+            self._console = Handler()
+            self._console.setFormatter(self.formatter)
+            self.addHandler(self._console)
+
+    def setTimestamp(self, precision='ms', datefmt='%H:%M:%S'):
+        """
+        Enables a timestamp column in front of every message, or disables it if precision is None.
+
+        Valid precisions are 's', 'ms' and 'us', or 'delta' for the seconds passed since the
+        logger was created. The date and time are formatted by `datefmt` using time.strftime,
+        which is only done once per second. See ``fastlog.timestamp.Timestamp``
+        """
+        self._timestamp = (precision, datefmt) if precision else None
+        for formatter in (self.formatter, self.plainFormatter):
+            formatter.setTimestamp(precision, datefmt, self._start)
+
+    def setMode(self, mode):
+        """
+        Selects how records reach the handlers:
+            * logging - The default. Records are logging.LogRecords created and handled by the
+                        inner logging.Logger, so logger filters and handlers added to it directly
+                        (or to its parents) see every record.
+            * native - Records are slotted ``fastlog.record.Record``s, handed straight to the
+                       fastlog handlers. Calls passing logging kwargs such as extra= or exc_info=
+                       still go through the inner logger.
+
+        In native mode, handlers and formatters which are not part of fastlog are given
+        an equivalent LogRecord, built when they first need it.
+        """
+        if mode not in ('logging', 'native'):
+            raise ValueError("%s is not a valid mode, use 'logging' or 'native'." % mode)
+        self._native = mode == 'native'
+
+    def setHexdumpCache(self, maxBytes=16 * 1024 * 1024):
+        """
+        Caches rendered hexdumps, so dumping the same data with the same arguments again
+        (retransmitted packets, identical headers, ...) reuses the earlier rendering.
+
+        The cache is bounded by the memory used by the renderings, `maxBytes`, evicting
+        the least recently used ones. 0 or None disables the cache. Only buffers are cached,
+        file objects are always read and rendered. See ``fastlog.hexdump.HexdumpCache``
+        """
+        self._hexcache = hexdump.HexdumpCache(maxBytes) if maxBytes else None
+
+    def setCollapse(self, enabled=True, timeout=1.0):
+        """
+        Collapses identical consecutive messages printed to the console into the first one
+        and a '... repeated N times' line. See ``Handler.setCollapse``
+
+        The console belongs to the top-level logger and is shared with its child loggers,
+        so this applies to all of them.
+        """
+        logger = self
+        while logger._parent is not None:
+            logger = logger._parent
+        logger._console.setCollapse(enabled, timeout)
+
+    def setCallsite(self, enabled=True):
+        """
+        Annotates every message with the file, line and function it was logged from.
+
+        The caller's frame is taken directly at a fixed depth instead of walking the stack,
+        and the rendered location is cached per code object and line, so repeated calls
+        from the same line cost a dictionary lookup. The location is also filled into the
+        records, so %(filename)s, %(lineno)d and %(funcName)s are accurate for other formatters.
+
+        Wrappers around the logging methods can pass stacklevel= to point at their own caller.
+        """
+        self._callsite = enabled
+        if enabled:
+            self.inner.findCaller = self._findCaller
+        else:
+            self.inner.__dict__.pop('findCaller', None)
+
+    def bind(self, **context):
+        """
+        Returns a logger adding key/value context to every message logged through it.
+
+        The context is rendered once here, and shown as a column in front of the message:
+
+        >>> conn = log.bind(conn_id=3, peer='10.0.0.1')
+        >>> conn.info('connected')
+        [*] conn_id=3 peer=10.0.0.1 connected
+
+        Bound loggers share everything else with the logger they are bound to, such as the
+        level, style, handlers and indentation, so they can be used with ``indent`` and
+        every other method. Binding a bound logger adds to its context.
+        """
+        return BoundLogger(self, context)
 
     def setLevel(self, level):
         """
         Sets the threshold for this handler to level. Logging messages which are less severe than level will be ignored.
+
+        Child loggers at NOTSET use the level of their closest parent with a level.
+        Levels must be set through fastlog, not on the inner logging.Loggers.
+        """
+        with self._lock:
+            self.inner.setLevel(level)
+            FastLogger._levelGeneration += 1
+
+    def getEffectiveLevel(self):
+        """
+        Returns the level of this logger, or of its closest parent with a level
+        """
+        if self._levelSeen != FastLogger._levelGeneration:
+            with self._lock:
+                generation = FastLogger._levelGeneration
+                self._effectiveLevel = self.inner.getEffectiveLevel()
+                self._levelSeen = generation
+        return self._effectiveLevel
+
+    def isEnabledFor(self, level):
+        """
+        Returns True if messages of this level are logged.
+
+        The effective level is cached until the level of a logger changes, so this costs a
+        comparison instead of walking the parent loggers.
+        """
+        if self._levelSeen != FastLogger._levelGeneration:
+            self.getEffectiveLevel()
+        return level >= self._effectiveLevel
+
+    def getChild(self, suffix):
+        """
+        Returns a child logger, eg. log.getChild('proto.tcp'), creating it and its parents as needed.
+
+        Child loggers have their own handlers and level. Their messages are also handled by
+        the handlers of their parents, including the console of the top-level logger. A child
+        at the NOTSET level uses the level of its parent, so the DEBUG output of a subsystem
+        can be turned on by itself:
+
+        >>> tcp = fastlog.getLogger('proto.tcp')
+        >>> tcp.setLevel(log.DEBUG)
+
+        Children are created with the style, timestamp, call site and mode settings of their
+        parent, which they can change on their own afterwards.
+        """
+        logger = self
+        with self._lock:
+            for part in suffix.split('.'):
+                child = logger._children.get(part)
+                if child is None:
+                    name = '%s.%s' % (logger.name, part) if logger.name else part
+                    child = logger._children[part] = FastLogger(name, logger)
+                logger = child
+        return logger
+
+    def _tree(self):
+        """
+        Yields this logger and all of its children
+        """
+        yield self
+        for child in list(self._children.values()):
+            for descendant in child._tree():
+                yield descendant
+
+    def onFork(self, callback):
+        """
+        Registers a callback run in child processes after a fork, with the logger. Use it to
+        give every worker its own sinks:
+
+        >>> log.onFork(lambda log: log.addHandler(IndexedFileHandler('worker.%d.log' % os.getpid())))
+
+        fastlog itself is made safe to use in forked children (Python 3.7+): its locks are
+        recreated, records queued by asynchronous handlers are left to the parent, their
+        threads are restarted and network connections reopened. File handlers which can't
+        share their file with the parent move to a file of their own, see their ``afterFork``
+        """
+        self._forkCallbacks.append(callback)
+
+    def _beforeFork(self):
+        # No thread is logging while the process forks, and nothing buffered is written twice
+        self._lock.acquire()
+        try:
+            sys.stdout.flush()
+        except Exception:
+            pass
+
+    def _afterForkParent(self):
+        self._lock.release()
+
+    def _afterForkChild(self):
+        lock = threading.RLock()
+        for logger in self._tree():
+            logger._lock = lock
+            logger._timings._lock = threading.Lock()
+            if logger._hexcache is not None:
+                logger._hexcache._lock = threading.Lock()
+            for handler in logger._handlers:
+                _afterFork(handler)
+
+        for callback in self._forkCallbacks:
+            try:
+                callback(self)
+            except Exception:
+                self.exception('Fork callback failed', exc_info=True)
+
+    def _dispatch(self, record):
+        """
+        Hands a record straight to the handlers of this logger and its parents, for the native mode
         """
-        self.inner.setLevel(level)
+        logger = self
+        while logger is not None:
+            logger._dispatcher.handle(record)
+            logger = logger._parent if logger.inner.propagate else None
+
+    def _dispatchMany(self, records):
+        logger = self
+        while logger is not None:
+            logger._dispatcher.handleMany(records)
+            logger = logger._parent if logger.inner.propagate else None
     
     def _log(self, lvl, msg, type, args, kwargs):
         """
         Internal method to filter into the formatter before being passed to the main Python logger
         """
+        if self._batching:
+            pending = getattr(self._batch, 'records', None)
+            if pending is not None:
+                return self._logBatched(pending, lvl, msg, type, args, kwargs)
+
+        if self._native and not kwargs:
+            self._lastlevel = lvl
+            if not self.isEnabledFor(lvl):
+                return
+
+            site = None
+            if self._callsite:
+                frame = sys._getframe(2)
+                site = _callsite(frame.f_code, frame.f_lineno)
+            record = Record(self.inner.name, lvl, msg, args, type, self._indent, site, self._context)
+            with self._lock:
+                self._dispatch(record)
+            return
+
         extra = kwargs.get('extra', {})
+        extra.setdefault("fastlog-clock", timestamp.monotonic())
         extra.setdefault("fastlog-type", type)
         extra.setdefault("fastlog-indent", self._indent)
+        if self._context is not None:
+            extra.setdefault("fastlog-context", self._context[0])
+            extra.setdefault("fastlog-fields", self._context[1])
         kwargs['extra'] = extra
 
         self._lastlevel = lvl
 
-        self.inner.log(lvl, msg, *args, **kwargs)
+        if self._callsite:
+            # The caller sits right above the public logging method, unless a stacklevel says otherwise
+            frame = sys._getframe(1 + kwargs.pop('stacklevel', 1))
+            site = _callsite(frame.f_code, frame.f_lineno)
+            extra.setdefault("fastlog-callsite", site[3])
+
+            with self._lock:
+                # Picked up by _findCaller while the record is created
+                self._site = site
+                self.inner.log(lvl, msg, *args, **kwargs)
+            return
+
+        with self._lock:
+            self.inner.log(lvl, msg, *args, **kwargs)
+
+    def _logBatched(self, pending, lvl, msg, type, args, kwargs):
+        """
+        Adds a record to the batch of the current thread. See ``batch``
+        """
+        self._lastlevel = lvl
+        if not self.isEnabledFor(lvl):
+            return
+
+        site = None
+        if self._callsite:
+            frame = sys._getframe(2 + kwargs.pop('stacklevel', 1))
+            site = _callsite(frame.f_code, frame.f_lineno)
+
+        if not kwargs:
+            pending.append(Record(self.inner.name, lvl, msg, args, type, self._indent, site, self._context))
+            return
+
+        # Logging kwargs need a complete LogRecord
+        extra = dict(kwargs.get('extra') or {})
+        extra.setdefault("fastlog-clock", timestamp.monotonic())
+        extra.setdefault("fastlog-type", type)
+        extra.setdefault("fastlog-indent", self._indent)
+        if self._context is not None:
+            extra.setdefault("fastlog-context", self._context[0])
+            extra.setdefault("fastlog-fields", self._context[1])
+        if site is not None:
+            extra.setdefault("fastlog-callsite", site[3])
+
+        exc_info = kwargs.get('exc_info')
+        if isinstance(exc_info, BaseException):
+            exc_info = (exc_info.__class__, exc_info, exc_info.__traceback__)
+        elif exc_info and not isinstance(exc_info, tuple):
+            exc_info = sys.exc_info()
+
+        pathname, lineno, funcName = site[:3] if site is not None else ('(unknown file)', 0, '(unknown function)')
+        pending.append(self.inner.makeRecord(self.inner.name, lvl, pathname, lineno, msg, args,
+                                             exc_info or None, funcName, extra))
+
+    def _logMany(self, lvl, type, messages):
+        """
+        Logs every message of an iterable with a single write per handler. See ``info_many``
+        """
+        self._lastlevel = lvl
+        if not self.isEnabledFor(lvl):
+            return
+
+        site = None
+        if self._callsite:
+            frame = sys._getframe(2)
+            site = _callsite(frame.f_code, frame.f_lineno)
+
+        name, indent, context = self.inner.name, self._indent, self._context
+        records = [Record(name, lvl, msg, (), type, indent, site, context) for msg in messages]
+
+        pending = getattr(self._batch, 'records', None) if self._batching else None
+        if pending is not None:
+            pending.extend(records)
+        elif records:
+            with self._lock:
+                self._dispatchMany(records)
+
+    def batch(self):
+        """
+        Begins a batch of messages. Must be used in a 'with' code block.
+
+        Messages logged by this thread inside of the block are collected, and handed to the
+        handlers together when the block exits: one write (and flush) per handler, under a
+        single acquisition of the logger lock, so the batch stays contiguous in the output
+        when other threads are logging. Batches may be nested, the outermost one is written.
+
+        Like in native mode, batched records go straight to the fastlog handlers. See ``setMode``
+
+        Example:
+
+        with log.batch():
+            for entry in entries:
+                log.info("%s", entry)
+        """
+        return BatchBlock(self)
+
+    def info_many(self, messages):
+        """
+        Logs every message of an iterable as an info message, with a single write per
+        handler. Messages are not %-formatted. See ``batch``
+        """
+        self._logMany(self.INFO, 'info', messages)
+
+    def debug_many(self, messages):
+        self._logMany(self.DEBUG, 'debug', messages)
+
+    def warning_many(self, messages):
+        self._logMany(self.WARNING, 'warning', messages)
+
+    def error_many(self, messages):
+        self._logMany(self.ERROR, 'error', messages)
+
+    def success_many(self, messages):
+        self._logMany(self.INFO, 'success', messages)
+
+    def failure_many(self, messages):
+        self._logMany(self.INFO, 'failure', messages)
+
+    def _findCaller(self, stack_info=False, stacklevel=1):
+        """
+        Replaces the inner logger's findCaller while call sites are enabled. See ``setCallsite``
+
+        The call site is taken by the logging methods, and used once. Direct calls to the
+        inner logger have none, their caller is looked up on the stack like logging does.
+        """
+        site, self._site = self._site, None
+        if site is None:
+            site = _outerCallsite(sys._getframe(1), stacklevel)
+        if six.PY2:
+            return site[:3]
+        return site[:3] + (None,)
     
     def info(self, msg, *args, **kwargs):
         self._log(self.INFO, msg, 'info', args, kwargs)
@@ -99,9 +559,37 @@ class FastLogger:
         self._log(self.INFO, msg, 'failure', args, kwargs)
     
     def exception(self, msg, *args, **kwargs):
-        #kwargs["exc_info"] = 1
-        self._log(self.ERROR, msg, 'exception', args, kwargs)
-        raise Exception(msg % args)
+        """
+        Logs an error with the 'exception' prefix.
+
+        Without exc_info, an Exception with the message is raised afterwards.
+
+        With exc_info=True, the exception being handled is logged below the message as a
+        styled traceback instead, and nothing is raised. exc_info may also be an exception
+        or a sys.exc_info() tuple. The limit= kwarg shows at most that many of the
+        innermost frames. See ``fastlog.tracebacks``
+
+        Example:
+
+        try:
+            parse()
+        except ValueError:
+            log.exception("parsing failed", exc_info=True, limit=5)
+        """
+        exc_info = kwargs.pop('exc_info', None)
+        limit = kwargs.pop('limit', None)
+        if not exc_info:
+            self._log(self.ERROR, msg, 'exception', args, kwargs)
+            raise Exception(msg % args)
+
+        exc_info = tracebacks.excinfo(exc_info)
+        if not self.isEnabledFor(self.ERROR):
+            return
+        if args:
+            msg = msg % args
+        if exc_info is not None:
+            msg = '%s\n%s' % (msg, self.compiled.traceback.render(exc_info, limit))
+        self._log(self.ERROR, msg, 'exception', (), kwargs)
     
     def separator(self, *args, **kwargs):
         """
@@ -125,6 +613,131 @@ class FastLogger:
         self._indent += 1
         return blk
     
+    def timed(self, label, level=None):
+        """
+        Times a block. Must be used in a 'with' code block.
+
+        Calls to the logger inside of the block are indented like with ``indent``. When the
+        block exits, its duration is logged as a success, or as a failure if it raised.
+        The duration is also added to the aggregates printed by ``timings``.
+
+        Example:
+
+        with log.timed("parse"):
+            parse()
+
+        [+] parse took 1.52ms
+        """
+        blk = TimedBlock(self, self._indent, label, level or self.INFO)
+        self._indent += 1
+        return blk
+
+    def timings(self, level=None, reset=False):
+        """
+        Prints a table of the durations of every label passed to ``timed``: count, number of
+        failures, total, mean, minimum, percentiles and maximum. Percentiles are accurate to
+        about 12%.
+
+        With reset=True, the aggregates start over afterwards.
+        """
+        rows = self._timings.rows()
+        if reset:
+            self._timings.reset()
+        if not rows:
+            return
+
+        columns = timing.Timings.columns
+        self.table(rows, columns, align='<' + '>' * (len(columns) - 1), level=level)
+
+    def table(self, rows, columns=None, widths=None, align=None, sample=100, batch=256, level=None):
+        """
+        Prints rows as an aligned table, indented under the current indentation.
+
+        Rows are sequences of cells, or dictionaries keyed by the column names. They are read
+        lazily, so generators of any size can be printed: column widths are taken from the
+        first `sample` rows unless given explicitly, and longer cells are cut short. Every
+        `batch` rows are written at once, see ``batch``. Other threads can't interleave their
+        messages with the table.
+
+        The table is styled by the `table` entry of the style. The escapes of every column
+        are looked up once per table.
+
+        The level of the last message printed is used unless specified otherwise with the level= kwarg
+
+        Arguments:
+            rows(iterable): The rows of the table
+            columns(list): Column names, printed as a header. Required for dictionary rows.
+            widths(list): Width of every column
+            align(str): Alignment of every column, '<' for left and '>' for right, one
+                        character per column. By default numbers are aligned right and
+                        anything else left.
+            sample(int): Rows used to size the columns when no widths are given
+            batch(int): Rows written at once
+        """
+        level = level or self._lastlevel
+        if not self.isEnabledFor(level):
+            return
+
+        def cells(row):
+            if isinstance(row, dict):
+                return [row.get(column, '') for column in columns]
+            return row
+
+        rows = iter(rows)
+        head = []
+        if widths is None:
+            head = [cells(row) for row in itertools.islice(rows, sample)]
+            count = len(columns) if columns else max([len(row) for row in head] or [0])
+            widths = [len(six.text_type(column)) for column in columns] if columns else [0] * count
+            for row in head:
+                for i, cell in enumerate(row[:count]):
+                    widths[i] = max(widths[i], len(six.text_type(cell)))
+        if not widths:
+            return
+        if align and len(align) != len(widths):
+            raise ValueError("align has %d columns, the table has %d" % (len(align), len(widths)))
+
+        style = getattr(self.style, 'table', None) or {}
+        colstyles = style.get('columns') or [None]
+        escapes = []
+        for i in range(len(widths)):
+            st = colstyles[i % len(colstyles)]
+            escapes.append((getattr(st, 'start', ''), getattr(st, 'reset', '')) if st else ('', ''))
+        last = len(widths) - 1
+
+        def render(row, escapes=escapes):
+            out = []
+            for i, width in enumerate(widths):
+                cell = row[i] if i < len(row) else ''
+                text = cell if isinstance(cell, six.string_types) else six.text_type(cell)
+                if len(text) > width:
+                    text = text[:width - 1] + u'\u2026' if width > 1 else text[:width]
+                if align:
+                    right = align[i] == '>'
+                else:
+                    right = isinstance(cell, numbers.Number) and not isinstance(cell, bool)
+                if right:
+                    text = text.rjust(width)
+                elif i < last:
+                    text = text.ljust(width)
+                opening, closing = escapes[i]
+                out.append(opening + text + closing if opening else text)
+            return '  '.join(out)
+
+        with self._lock:
+            if columns:
+                header = style.get('header')
+                rule = style.get('rule') or (lambda text: text)
+                headerEscapes = [(getattr(header, 'start', ''), getattr(header, 'reset', ''))] * len(widths)
+                self._logMany(level, 'table', [render(columns, headerEscapes),
+                                               rule('  '.join(u'\u2500' * width for width in widths))])
+
+            rows = itertools.chain(head, (cells(row) for row in rows))
+            chunk = list(itertools.islice(rows, batch))
+            while chunk:
+                self._logMany(level, 'table', [render(row) for row in chunk])
+                chunk = list(itertools.islice(rows, batch))
+
     def setIndent(self, indent):
         """
         Sets the current indentation level
@@ -140,6 +753,9 @@ class FastLogger:
         levelOverride = kwargs.get('level') or self._lastlevel
         self._log(levelOverride, '', 'newline', args, kwargs)
 
+    # Keyword arguments of `hexdump` which are passed on to the hexdump renderer
+    _hexdumpArgs = ('width', 'skip', 'hexii', 'begin', 'highlight')
+
     def hexdump(self, s, *args, **kwargs):
         """
         Outputs a colorful hexdump of the first argument. 
@@ -157,10 +773,94 @@ class FastLogger:
             hexii(bool): Set to True, if a hexii-dump should be returned instead of a hexdump.
             begin(int):  Offset of the first byte to print in the left column
             highlight(iterable): Byte values to highlight.
+
+        Large dumps can be streamed with the batch= kwarg. Instead of rendering the whole dump
+        into a single record, every `batch` lines are sent to the handlers as soon as they
+        are rendered. The batches are emitted while holding the logger lock, so other threads
+        cannot interleave their messages with the dump.
         """
-        levelOverride = kwargs.get('level') or self._lastlevel
-        hexdmp = hexdump.hexdump(self, s, **kwargs)
-        self._log(levelOverride, hexdmp, 'indented', args, kwargs)
+        levelOverride = kwargs.pop('level', None) or self._lastlevel
+        batch = kwargs.pop('batch', None)
+        hexargs = dict((k, kwargs.pop(k)) for k in self._hexdumpArgs if k in kwargs)
+        if hexargs.get('highlight') is not None:
+            # Read once, for the cache key and the rendering
+            hexargs['highlight'] = tuple(hexargs['highlight'])
+
+        # Don't bother rendering a dump nobody will see
+        if not self.isEnabledFor(levelOverride):
+            return
+
+        cache = self._hexcache
+        key = hexdmp = None
+        if cache is not None and not hasattr(s, 'read'):
+            s = hexdump._flat(s)
+            key = cache.key(s, hexargs)
+            if key is not None:
+                hexdmp = cache.get(key)
+
+        if not batch:
+            if hexdmp is None:
+                hexdmp = hexdump.hexdump(self, s, **hexargs)
+                if key is not None:
+                    cache.put(key, hexdmp)
+            self._log(levelOverride, hexdmp, 'indented', args, kwargs)
+            return
+
+        if hexdmp is not None:
+            lines = iter(hexdmp.split('\n'))
+        else:
+            lines = hexdump.hexdump_iter(self, s, **hexargs)
+
+        # Streamed dumps are kept for the cache as long as they would fit in it
+        rendered = [] if hexdmp is None and key is not None else None
+        size = 0
+        with self._lock:
+            chunk = list(itertools.islice(lines, batch))
+            while chunk:
+                text = '\n'.join(chunk)
+                # _log fills in the extra dict, every batch gets its own
+                batchKwargs = dict(kwargs)
+                if 'extra' in kwargs:
+                    batchKwargs['extra'] = dict(kwargs['extra'])
+                self._log(levelOverride, text, 'indented', (), batchKwargs)
+                if rendered is not None:
+                    rendered.append(text)
+                    size += len(text)
+                    if size > cache.maxBytes:
+                        rendered = None
+                chunk = list(itertools.islice(lines, batch))
+        if rendered is not None:
+            cache.put(key, '\n'.join(rendered))
+
+class BoundLogger(FastLogger):
+    """
+    A FastLogger with key/value context, created by ``FastLogger.bind``.
+
+    Bound loggers are lightweight views of the root logger: they only hold their context,
+    any other attribute is read from and written to the root logger.
+    """
+
+    def __init__(self, root, context):
+        if isinstance(root, BoundLogger):
+            fields = dict(root._context[1])
+            fields.update(context)
+            root = root._root
+        else:
+            fields = dict(context)
+        self.__dict__['_root'] = root
+        self.__dict__['_context'] = (_renderContext(fields), fields)
+
+    def __getattr__(self, name):
+        return getattr(self._root, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._root, name, value)
+
+def _renderContext(fields):
+    """
+    Renders the context column of a bound logger
+    """
+    return ' '.join('%s=%s' % (k, v) for k, v in fields.items())
 
 class IndentBlock(object):
     """
@@ -183,6 +883,96 @@ class IndentBlock(object):
     def __exit__(self, exc_typ, exc_val, exc_tb):
         self.parent.setIndent(self.old)
 
+class BatchBlock(object):
+    """
+    Collects the messages of a thread and writes them together on exit. See ``FastLogger.batch``
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.outermost = False
+
+    def __enter__(self):
+        state = self.parent._batch
+        if getattr(state, 'records', None) is None:
+            state.records = []
+            self.outermost = True
+            with self.parent._lock:
+                self.parent._batching += 1
+        return self
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        if not self.outermost:
+            return
+        state = self.parent._batch
+        records, state.records = state.records, None
+        with self.parent._lock:
+            self.parent._batching -= 1
+            if records:
+                self.parent._dispatchMany(records)
+
+class TimedBlock(IndentBlock):
+    """
+    An indented block which logs its duration on exit. See ``FastLogger.timed``
+    """
+
+    def __init__(self, parent, oldIndentLevel, label, level):
+        IndentBlock.__init__(self, parent, oldIndentLevel)
+        self.label = label
+        self.level = level
+        self.start = None
+
+    def __enter__(self):
+        self.start = timing._clock()
+        return self
+
+    def __exit__(self, exc_typ, exc_val, exc_tb):
+        ns = timing._clock() - self.start
+        self.parent.setIndent(self.old)
+
+        failed = exc_typ is not None
+        self.parent._timings.add(self.label, ns, failed)
+        if failed:
+            self.parent._log(self.level, '%s failed after %s (%s)', 'failure',
+                             (self.label, timing.duration(ns), exc_typ.__name__), {})
+        else:
+            self.parent._log(self.level, '%s took %s', 'success', (self.label, timing.duration(ns)), {})
+
+# Rendered call sites by (code object, line number)
+_callsites = {}
+
+def _callsite(code, lineno):
+    """
+    Returns the (pathname, line, function, rendered location) of a call site
+    """
+    try:
+        return _callsites[code, lineno]
+    except KeyError:
+        filename = code.co_filename
+        site = _callsites[code, lineno] = (filename, lineno, code.co_name, '%s:%d:%s' % (
+            os.path.basename(filename), lineno, code.co_name))
+        return site
+
+# Files of the frames skipped by _outerCallsite
+_internalFiles = frozenset(filter(None, (logging._srcfile, os.path.normcase(_callsite.__code__.co_filename))))
+
+def _outerCallsite(frame, stacklevel=1):
+    """
+    Returns the call site of the first frame outside of logging and fastlog, or of its
+    callers `stacklevel` - 1 levels up
+    """
+    while frame is not None and os.path.normcase(frame.f_code.co_filename) in _internalFiles:
+        frame = frame.f_back
+    while frame is not None and stacklevel > 1 and frame.f_back is not None:
+        frame = frame.f_back
+        stacklevel -= 1
+    if frame is None:
+        return ('(unknown file)', 0, '(unknown function)', None)
+    return _callsite(frame.f_code, frame.f_lineno)
+
+# Terminal escape sequences, stripped from messages by uncolored formatters
+_escapes = re.compile('\x1b(?:\\[[0-9;?]*[A-Za-z]|\\(B)')
+
 class Formatter(logging.Formatter):
     """
     Logging formatter which performs custom formatting for log records
@@ -204,6 +994,10 @@ class Formatter(logging.Formatter):
         * separator
         * newline
         * indented
+        * table
+
+    The style is compiled into render functions when the formatter is created, so
+    changes made to a style module afterwards require a new formatter. See ``fastlog.compiler``
     """
 
     # Indentation from the left side of the terminal.
@@ -213,61 +1007,352 @@ class Formatter(logging.Formatter):
     # Newline, followed by an indent.  Used to wrap multiple lines.
     nlindent  = '\n' + indent
 
+    # Message types which continue or separate other messages and get no call site or context column
+    _unannotated = frozenset(('separator', 'newline', 'animated', 'indented', 'table'))
+
     def __init__(self, style, *args, **kwargs):
+        # color=False renders the style without any escape sequences, eg. for log files
+        self.color = kwargs.pop('color', True)
         super(Formatter, self).__init__(*args, **kwargs)
         self.style = style
-        self.indent = self.style.indent
-        self.nlindent = '\n' + self.indent
+        self.compiled = compiler.compile_style(style, self.color)
+        self.indent = self.compiled.indent
+        self.nlindent = self.compiled.nlindent
+
+        # Without a custom format string the message can be used as is
+        self._plain = getattr(self, '_fmt', None) in (None, '%(message)s')
+
+        # Optional timestamp column. See setTimestamp
+        self.timestamp = None
+
+    def setTimestamp(self, precision='ms', datefmt='%H:%M:%S', start=None):
+        """
+        Puts a timestamp in front of every message, or removes it if precision is None.
+        See ``fastlog.timestamp.Timestamp``
+        """
+        if precision is None:
+            self.timestamp = None
+        else:
+            self.timestamp = timestamp.Timestamp(precision, datefmt, start,
+                                                 self.compiled.tsopen, self.compiled.tsclose + ' ')
 
     def format(self, record):
-        # use the default formatter to actually format the record
-        msg = super(Formatter, self).format(record)
+        if self._plain and not (record.exc_info or record.exc_text or getattr(record, 'stack_info', None)):
+            msg = record.message = record.getMessage()
+        else:
+            # use the default formatter to actually format the record
+            msg = super(Formatter, self).format(logRecord(record))
+
+        # messages such as hexdumps arrive pre-styled
+        if not self.color and '\x1b' in msg:
+            msg = _escapes.sub('', msg)
 
         # then put on a prefix symbol according to the message type
-        msgtype = getattr(record, 'fastlog-type', None)
-        
-        # Number of indents to the prefix
-        indentLevel = getattr(record, 'fastlog-indent', None)
-        
+        native = record.__class__ is Record
+        msgtype = record.type if native else getattr(record, 'fastlog-type', None)
+
         # if 'fastlog-type' is not set (or set to `None`) we just return the
         # message as it is
         if msgtype is None:
             return msg
 
-        prefix = self.indent*indentLevel
-
-        if msgtype == 'separator':
-            stylefunc, symb = self.style.separator
-            msg = stylefunc(symb)
-        elif msgtype == 'newline':
-            msg = ''
-            prefix = ''
-        elif msgtype == 'animated':
-            # the handler will take care of updating the spinner, so we will
-            # not include it here
-            prefix = ''
-        elif msgtype == 'indented':
-            prefix = self.indent
-        elif msgtype in self.style.prefixes:
-            # Execute the prefix style function if the prefix exists
-            stylefunc, symb = self.style.prefixes[msgtype]
-            prefix += '[%s] ' % stylefunc(symb)
-        else:
-            # No valid prefix was found, fallback on a default
-            prefix += '[?] '
+        if msgtype not in self._unannotated:
+            # Optional context column. See FastLogger.bind
+            context = record.context if native else getattr(record, 'fastlog-context', None)
+            if context:
+                msg = self.compiled.ctxopen + context + self.compiled.ctxclose + msg
+
+            # Optional call site column. See FastLogger.setCallsite
+            site = record.callsite if native else getattr(record, 'fastlog-callsite', None)
+            if site is not None:
+                msg = self.compiled.siteopen + site + self.compiled.siteclose + msg
+
+        # Number of indents to the prefix
+        indentLevel = record.indent if native else getattr(record, 'fastlog-indent', None)
 
-        msg = prefix + msg
-        msg = self.nlindent.join(msg.splitlines())
+        msg = self.compiled.renderers.get(msgtype, self.compiled.fallback)(msg, indentLevel)
+        if self.timestamp is not None and msgtype != 'newline':
+            return self.timestamp(record.created, getattr(record, 'fastlog-clock', None)) + msg
         return msg
 
 class Handler(logging.StreamHandler):
     """
     An instance of a fastlog handler
     """
+
+    # Identical consecutive records are collapsed while this is set. See setCollapse
+    collapseTimeout = None
+
+    def __init__(self, *args, **kwargs):
+        logging.StreamHandler.__init__(self, *args, **kwargs)
+
+        # Key of the last record written, and the number of copies since
+        self._last = None
+        self._repeats = 0
+        self._timer = None
+
     @property
     def stream(self):
         return sys.stdout
     
     @stream.setter
     def stream(self, value):
-        pass
\ No newline at end of file
+        pass
+
+    def setCollapse(self, enabled=True, timeout=1.0):
+        """
+        Collapses identical consecutive records: same logger, type, indentation, message,
+        bound context and call site, ie. everything rendered but the timestamp.
+        Only the first one is written, the copies are counted and reported by a
+        '... repeated N times' line once a different record comes in, or after `timeout`
+        seconds.
+        """
+        self.acquire()
+        try:
+            self._endRun()
+            self.collapseTimeout = timeout if enabled else None
+            self._last = None
+        finally:
+            self.release()
+
+    def _collapse(self, record, msg, out):
+        """
+        Appends the text to write for a formatted record to `out`. Called with the handler lock held.
+        """
+        key = (getattr(record, 'fastlog-type', None), getattr(record, 'fastlog-indent', None),
+               getattr(record, 'message', None) or msg, record.name,
+               getattr(record, 'fastlog-context', None), getattr(record, 'fastlog-callsite', None))
+        if key == self._last:
+            self._repeats += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.collapseTimeout, self._timeout)
+                self._timer.daemon = True
+                self._timer.start()
+            return
+
+        summary = self._summary()
+        if summary is not None:
+            out.append(summary)
+        self._last = key
+        out.append(msg)
+
+    def _summary(self):
+        """
+        Ends the current run of copies, returning the line reporting them or None
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        repeats, self._repeats = self._repeats, 0
+        if not repeats:
+            return None
+        indent = self.formatter.indent if isinstance(self.formatter, Formatter) else '    '
+        return '%s... repeated %d times' % (indent * ((self._last[1] or 0) + 1), repeats)
+
+    def _endRun(self):
+        summary = self._summary()
+        if summary is not None:
+            self.stream.write(summary + self.terminator)
+            self.flush()
+
+    def _timeout(self):
+        self.acquire()
+        try:
+            self._endRun()
+        except Exception:
+            pass
+        finally:
+            self.release()
+
+    def emitFormatted(self, record, msg):
+        """
+        Writes a record which has already been formatted. See ``Dispatcher``
+        """
+        if self.collapseTimeout is None:
+            _emitFormatted(self, record, msg)
+            return
+        self.emitManyFormatted((record,), (msg,))
+
+    def emitManyFormatted(self, records, msgs):
+        """
+        Writes formatted records at once. See ``Dispatcher.handleMany``
+        """
+        if self.collapseTimeout is None:
+            _emitManyFormatted(self, records, msgs)
+            return
+
+        self.acquire()
+        try:
+            out = []
+            for record, msg in zip(records, msgs):
+                self._collapse(record, msg, out)
+            if out:
+                self.stream.write(self.terminator.join(out) + self.terminator)
+                self.flush()
+        except Exception:
+            self.handleError(logRecord(records[0]))
+        finally:
+            self.release()
+
+    def afterFork(self):
+        # Copies counted by the parent are reported by the parent
+        self._last = None
+        self._repeats = 0
+        self._timer = None
+
+    def close(self):
+        self.acquire()
+        try:
+            self._endRun()
+        finally:
+            self.release()
+        logging.StreamHandler.close(self)
+
+def _afterFork(handler):
+    """
+    Prepares a handler for use in a forked child. Handler locks are recreated by the logging module.
+    """
+    afterFork = getattr(handler, 'afterFork', None)
+    if afterFork is not None:
+        afterFork()
+
+# emit methods which only write the formatted record, so it can be written for them.
+# Subclasses doing more (rotating, reopening, ...) are given records through handle()
+_plainEmits = tuple(getattr(emit, '__func__', emit) for emit in (logging.StreamHandler.emit, logging.FileHandler.emit))
+
+def _writesFormatted(handler):
+    """
+    True if a stream handler can be given an already formatted record, see ``_emitFormatted``
+    """
+    return (isinstance(handler, logging.StreamHandler) and handler.formatter is not None
+            and getattr(type(handler).emit, '__func__', type(handler).emit) in _plainEmits)
+
+def _emitFormatted(handler, record, msg):
+    """
+    Writes a formatted record to a stream handler the same way ``StreamHandler.emit`` does
+    """
+    handler.acquire()
+    try:
+        if handler.stream is None:
+            # A delayed FileHandler opens its file on the first emit
+            handler.emit(logRecord(record))
+        else:
+            handler.stream.write(msg + getattr(handler, 'terminator', '\n'))
+            handler.flush()
+    except Exception:
+        handler.handleError(logRecord(record))
+    finally:
+        handler.release()
+
+def _emitManyFormatted(handler, records, msgs):
+    """
+    Writes formatted records to a stream handler with a single write and flush
+    """
+    handler.acquire()
+    try:
+        if handler.stream is None:
+            for record in records:
+                handler.emit(logRecord(record))
+        else:
+            terminator = getattr(handler, 'terminator', '\n')
+            handler.stream.write(terminator.join(msgs) + terminator)
+            handler.flush()
+    except Exception:
+        handler.handleError(logRecord(records[0]))
+    finally:
+        handler.release()
+
+class Dispatcher(logging.Handler):
+    """
+    Fans out records from the inner logger to every fastlog sink.
+
+    Each record is formatted once per distinct formatter and the result is reused by all
+    sinks sharing that formatter. With a console and any number of file sinks, a record is
+    rendered at most twice: once colored and once plain.
+
+    Sinks which are not plain stream or file handlers are passed the record as usual. Records of the native
+    mode are converted to LogRecords for sinks, filters and formatters which are not part of
+    fastlog. Handlers taking native records set `nativeRecords`.
+    """
+    def __init__(self, sinks):
+        logging.Handler.__init__(self)
+        self.sinks = sinks
+
+    def handle(self, record):
+        rendered = {}
+        for sink in self.sinks:
+            if record.levelno < sink.level:
+                continue
+
+            emit = getattr(sink, 'emitFormatted', None)
+            if emit is None:
+                if not _writesFormatted(sink):
+                    sink.handle(record if getattr(sink, 'nativeRecords', False) else logRecord(record))
+                    continue
+                emit = functools.partial(_emitFormatted, sink)
+
+            if sink.filters and not sink.filter(logRecord(record)):
+                continue
+
+            formatter = sink.formatter
+            msg = rendered.get(formatter)
+            if msg is None:
+                try:
+                    msg = rendered[formatter] = formatter.format(
+                        record if isinstance(formatter, Formatter) else logRecord(record))
+                except Exception:
+                    sink.handleError(logRecord(record))
+                    continue
+            emit(record, msg)
+        return True
+
+    def handleMany(self, records):
+        """
+        Fans out a batch of records. Sinks providing `emitManyFormatted` are given the whole
+        batch at once, other sinks get the records one by one.
+        """
+        rendered = {}
+        for sink in self.sinks:
+            emit = getattr(sink, 'emitFormatted', None)
+            if emit is None:
+                if not _writesFormatted(sink):
+                    native = getattr(sink, 'nativeRecords', False)
+                    for record in records:
+                        if record.levelno >= sink.level:
+                            sink.handle(record if native else logRecord(record))
+                    continue
+                emitMany = functools.partial(_emitManyFormatted, sink)
+            else:
+                emitMany = getattr(sink, 'emitManyFormatted', None)
+
+            formatter = sink.formatter
+            fmtrecord = (lambda record: record) if isinstance(formatter, Formatter) else logRecord
+            msgs = rendered.setdefault(formatter, {})
+
+            selected = []
+            selectedMsgs = []
+            for i, record in enumerate(records):
+                if record.levelno < sink.level:
+                    continue
+                if sink.filters and not sink.filter(logRecord(record)):
+                    continue
+                msg = msgs.get(i)
+                if msg is None:
+                    try:
+                        msg = msgs[i] = formatter.format(fmtrecord(record))
+                    except Exception:
+                        sink.handleError(logRecord(record))
+                        continue
+                selected.append(record)
+                selectedMsgs.append(msg)
+
+            if not selected:
+                continue
+            if emitMany is not None:
+                emitMany(selected, selectedMsgs)
+            else:
+                for record, msg in zip(selected, selectedMsgs):
+                    emit(record, msg)
+
+    def emit(self, record):
+        self.handle(record)
@@ -0,0 +1,102 @@
+# Lightweight records of the native logging mode
+import logging
+import time
+
+import six
+
+from .timestamp import monotonic
+
+class Record(object):
+    """
+    A log record holding only what fastlog uses, created by loggers in native mode.
+    See ``FastLogger.setMode``
+
+    Records provide the LogRecord attributes read by fastlog formatters and handlers,
+    including the fastlog-* attributes, which map onto slots. Handlers and formatters
+    expecting a complete LogRecord get one from ``logRecord``.
+    """
+
+    __slots__ = ('name', 'msg', 'args', 'levelno', 'created', 'type', 'indent', 'site', 'context',
+                 'fields', 'clock', 'message', 'exc_info', 'exc_text', 'stack_info', '_record')
+
+    def __init__(self, name, levelno, msg, args, msgtype, indent, site=None, context=None):
+        """
+        Arguments:
+            site(tuple): Call site as returned by ``fastlog.log._callsite``, or None
+            context(tuple): (rendered fragment, fields) of a bound logger, or None
+        """
+        self.name = name
+        self.levelno = levelno
+        self.msg = msg
+        self.args = args
+        self.created = time.time()
+        self.clock = monotonic()
+        self.type = msgtype
+        self.indent = indent
+        self.site = site
+        self.context, self.fields = context or (None, None)
+        self.message = None
+        self.exc_info = None
+        self.exc_text = None
+        self.stack_info = None
+        self._record = None
+
+    @property
+    def levelname(self):
+        return logging.getLevelName(self.levelno)
+
+    @property
+    def callsite(self):
+        return self.site[3] if self.site is not None else None
+
+    def getMessage(self):
+        # Unicode messages stay unicode on Python 2, like LogRecord.getMessage
+        msg = self.msg
+        if not isinstance(msg, six.string_types):
+            try:
+                msg = str(msg)
+            except UnicodeError:
+                pass
+        if self.args:
+            msg = msg % self.args
+        return msg
+
+    def logRecord(self):
+        """
+        Returns an equivalent logging.LogRecord, created once per record
+        """
+        if self._record is None:
+            pathname, lineno, funcName = self.site[:3] if self.site is not None else ('', 0, None)
+            record = logging.LogRecord(self.name, self.levelno, pathname, lineno, self.msg,
+                                       self.args, self.exc_info, funcName)
+            record.created = self.created
+            record.msecs = (self.created - int(self.created)) * 1000
+            record.relativeCreated = (self.created - logging._startTime) * 1000
+
+            extra = {'fastlog-type': self.type, 'fastlog-indent': self.indent, 'fastlog-clock': self.clock}
+            if self.site is not None:
+                extra['fastlog-callsite'] = self.site[3]
+            if self.context is not None:
+                extra['fastlog-context'] = self.context
+                extra['fastlog-fields'] = self.fields
+            record.__dict__.update(extra)
+            self._record = record
+        return self._record
+
+def _slotProperty(slot):
+    return property(lambda self: getattr(self, slot), lambda self, value: setattr(self, slot, value))
+
+# The attribute names used on LogRecords, eg. getattr(record, 'fastlog-type')
+for _name, _slot in (('fastlog-type', 'type'), ('fastlog-indent', 'indent'),
+                     ('fastlog-context', 'context'), ('fastlog-fields', 'fields'),
+                     ('fastlog-clock', 'clock')):
+    setattr(Record, _name, _slotProperty(_slot))
+setattr(Record, 'fastlog-callsite', Record.callsite)
+
+def logRecord(record):
+    """
+    Returns a logging.LogRecord for any record
+    """
+    if isinstance(record, Record):
+        return record.logRecord()
+    return record
@@ -62,6 +62,50 @@ The second element of the list is the characters to print out for the separator
 """
 separator = [ Style({'fg': 'gray'}), '-'*87 ]
 
+"""
+The `timestamp` variable defines the style of the optional timestamp column, see `log.setTimestamp()`
+"""
+timestamp = Style({'fg': 'gray'})
+
+"""
+The `callsite` variable defines the style of the optional file:line:function column, see `log.setCallsite()`
+"""
+callsite = Style({'fg': 'gray'})
+
+"""
+The `context` variable defines the style of the key=value column of bound loggers, see `log.bind()`
+"""
+context = Style({'fg': 'cyan'})
+
+"""
+The `table` variable defines the style of tables printed with `log.table()`
+
+The style names are:
+    * header - The style of the column names
+    * rule - The style of the line below the column names
+    * columns - A list of styles for the cells of each column, repeated for tables with more
+                columns. None leaves the column unstyled.
+"""
+table = {
+    'header':  Style({'fmt': 'b'}),
+    'rule':    Style({'fg': 'gray'}),
+    'columns': [Style({'fg': 'cyan'}), None],
+}
+
+"""
+The `traceback` variable defines the style of tracebacks logged with `log.exception(..., exc_info=True)`
+
+The style names are:
+    * location - The 'File "...", line N, in func' line of each frame
+    * source - The source line of each frame
+    * exception - The exception type and message
+"""
+traceback = {
+    'location':  Style({'fg': 'gray'}),
+    'source':    Style({}),
+    'exception': Style({'fmt': 'b', 'fg': 'red'}),
+}
+
 """
 The `hexdump` variable defines the style of the hexdump output.
 
@@ -112,6 +112,10 @@ class Style(object):
 
         self.decorator = ret_func
 
+        # The raw escapes around a styled message, for callers which render their own text
+        self.start = ret
+        self.reset = reset
+
 
 
 def typeseq(types):
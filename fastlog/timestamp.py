@@ -0,0 +1,79 @@
+# Cached timestamp rendering for the optional time column
+import time
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    # Python 2 has no monotonic clock
+    monotonic = time.time
+
+# Number of sub-second digits for each precision
+precisions = {
+    's':  0,
+    'ms': 3,
+    'us': 6,
+}
+
+class Timestamp(object):
+    """
+    Renders record creation times for the timestamp column of a formatter.
+
+    Rendering the date and time with strftime is only done once per second. The cached
+    text is reused for every record created within that second, and only the sub-second
+    digits are rendered per record.
+
+    Valid precisions are:
+        * 's' for whole seconds
+        * 'ms' for milliseconds
+        * 'us' for microseconds
+        * 'delta' for the seconds passed since `start`, with microsecond digits
+
+    Deltas are measured on the `monotonic` clock, so they don't jump when the system clock
+    is set. `start` is a value of that clock.
+    """
+
+    def __init__(self, precision='ms', datefmt='%H:%M:%S', start=None, prefix='', suffix=' '):
+        """
+        Creates a timestamp renderer.
+
+        The rendered text is wrapped in `prefix` and `suffix`, which formatters use for
+        the escape sequences of the timestamp style.
+        """
+        if precision != 'delta' and precision not in precisions:
+            raise ValueError("%s is not a valid timestamp precision." % precision)
+
+        self.precision = precision
+        self.datefmt = datefmt
+        self.start = monotonic() if start is None else start
+        self.prefix = prefix
+        self.suffix = suffix
+
+        digits = precisions.get(precision, 6)
+        self._scale = 10 ** digits
+        self._fraction = '.%%0%dd%s' % (digits, suffix) if digits else suffix
+
+        # (second, rendered text up to the second)
+        self._cached = (None, '')
+
+    def __call__(self, created, clock=None):
+        """
+        Returns the rendered timestamp of a time as returned by time.time()
+
+        Arguments:
+            clock(float): The `monotonic` time of the record, for deltas
+        """
+        if self.precision == 'delta':
+            if clock is None:
+                # Records created outside of fastlog only carry their wall clock time
+                clock = monotonic() - (time.time() - created)
+            return '%s%12.6f%s' % (self.prefix, clock - self.start, self.suffix)
+
+        second = int(created)
+        cached = self._cached
+        if cached[0] != second:
+            # Swapped in as one tuple, so other threads never see a half updated cache
+            cached = self._cached = (second, self.prefix + time.strftime(self.datefmt, time.localtime(second)))
+
+        if self._scale == 1:
+            return cached[1] + self._fraction
+        return cached[1] + self._fraction % int((created - second) * self._scale)
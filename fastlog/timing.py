@@ -0,0 +1,120 @@
+# Aggregated timings of log.timed() blocks
+import collections
+import threading
+import time
+
+try:
+    _clock = time.perf_counter_ns
+except AttributeError:
+    # Python 2 and Python < 3.7
+    def _clock():
+        return int(time.time() * 1e9)
+
+def bucket(ns):
+    """
+    Returns the histogram bucket of a duration in nanoseconds.
+
+    Buckets split every power of two in 8, keeping durations within 12.5% of each other.
+    Durations below 16ns get a bucket of their own.
+    """
+    shift = max(ns.bit_length() - 4, 0)
+    return 8 * shift + (ns >> shift)
+
+def bucketRange(index):
+    """
+    Returns the (lowest, highest) duration in nanoseconds of a histogram bucket
+    """
+    shift = max(index // 8 - 1, 0)
+    low = (index - 8 * shift) << shift
+    return low, low + (1 << shift) - 1
+
+def duration(ns):
+    """
+    Renders a duration in nanoseconds with a fitting unit, eg. 1.23ms
+    """
+    if ns < 1000:
+        return '%dns' % ns
+    if ns < 1000000:
+        return '%.2fus' % (ns / 1e3)
+    if ns < 1000000000:
+        return '%.2fms' % (ns / 1e6)
+    return '%.3fs' % (ns / 1e9)
+
+class Timing(object):
+    """
+    Aggregates the durations of one label: count, total, minimum, maximum and a
+    logarithmic histogram for percentiles. Adding a duration costs a few integer operations.
+    """
+
+    __slots__ = ('count', 'total', 'min', 'max', 'failures', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.failures = 0
+        self.buckets = collections.Counter()
+
+    def add(self, ns, failed=False):
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if self.max is None or ns > self.max:
+            self.max = ns
+        if failed:
+            self.failures += 1
+        self.buckets[bucket(ns)] += 1
+
+    @property
+    def mean(self):
+        return self.total // self.count if self.count else 0
+
+    def percentile(self, q):
+        """
+        Returns the approximate duration below which `q` percent of the durations fall
+        """
+        if not self.count:
+            return 0
+        wanted = max(self.count * q / 100.0, 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= wanted:
+                low, high = bucketRange(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+class Timings(object):
+    """
+    Timings of every label measured by a logger
+    """
+
+    # Columns of ``rows``
+    columns = ('label', 'count', 'failed', 'total', 'mean', 'min', 'p50', 'p90', 'p99', 'max')
+
+    def __init__(self):
+        self.labels = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, label, ns, failed=False):
+        with self._lock:
+            timing = self.labels.get(label)
+            if timing is None:
+                timing = self.labels[label] = Timing()
+            timing.add(ns, failed)
+
+    def reset(self):
+        with self._lock:
+            self.labels.clear()
+
+    def rows(self):
+        """
+        Returns one row of rendered values per label, see `columns`
+        """
+        with self._lock:
+            items = list(self.labels.items())
+        return [(label, str(t.count), str(t.failures), duration(t.total), duration(t.mean),
+                 duration(t.min), duration(t.percentile(50)), duration(t.percentile(90)),
+                 duration(t.percentile(99)), duration(t.max)) for label, t in items]
@@ -0,0 +1,124 @@
+# Styled tracebacks for log.exception
+import linecache
+import sys
+
+# Separators of chained exceptions, as printed by Python
+_causeMessage = 'The above exception was the direct cause of the following exception:'
+_contextMessage = 'During handling of the above exception, another exception occurred:'
+
+# Chained exceptions shown at most, the rest is left out
+MAX_CHAIN = 8
+
+def _plain(text):
+    return text
+
+class TracebackRenderer(object):
+    """
+    Renders tracebacks with a traceback style dictionary.
+
+    The style may provide the following keys, missing keys are left unstyled:
+        * location - The 'File "...", line N, in func' line of a frame
+        * source - The source line of a frame
+        * exception - The exception type and message
+
+    Source lines are read through ``linecache``, and the rendering of a frame is cached per
+    code object and line, so tracebacks through the same frames render them only once.
+    """
+
+    def __init__(self, style=None):
+        style = style or {}
+        self.location = style.get('location') or _plain
+        self.source = style.get('source') or _plain
+        self.exception = style.get('exception') or _plain
+        self._frames = {}
+
+    def frame(self, code, lineno):
+        """
+        Returns the rendered lines of a frame
+        """
+        try:
+            return self._frames[code, lineno]
+        except KeyError:
+            pass
+
+        filename = code.co_filename
+        lines = [self.location('  File "%s", line %d, in %s' % (filename, lineno, code.co_name))]
+        line = linecache.getline(filename, lineno).strip()
+        if line:
+            lines.append('    ' + self.source(line))
+        rendered = self._frames[code, lineno] = '\n'.join(lines)
+        return rendered
+
+    def _frames_of(self, tb):
+        frames = []
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code, tb.tb_lineno))
+            tb = tb.tb_next
+        return frames
+
+    def _render(self, typ, value, tb, limit):
+        lines = []
+        frames = self._frames_of(tb)
+        if frames:
+            lines.append('Traceback (most recent call last):')
+
+            # The innermost frames are the interesting ones
+            if limit is not None and len(frames) > limit:
+                lines.append('  ... %d frames hidden' % (len(frames) - limit))
+                frames = frames[len(frames) - limit:] if limit else []
+            lines.extend(self.frame(code, lineno) for code, lineno in frames)
+
+        text = getattr(typ, '__name__', str(typ))
+        if value is not None and str(value):
+            text += ': %s' % value
+        lines.append(self.exception(text))
+        return lines
+
+    def render(self, exc_info, limit=None):
+        """
+        Renders an exception given as a (type, value, traceback) tuple, with chained
+        exceptions first like Python does.
+
+        Arguments:
+            exc_info(tuple): The exception, as returned by sys.exc_info()
+            limit(int): Frames shown at most per exception. The innermost frames are kept.
+        """
+        typ, value, tb = exc_info
+        chain = [(None, typ, value, tb)]
+
+        # Python 3 exception chaining
+        seen = set([id(value)])
+        while value is not None and len(chain) < MAX_CHAIN:
+            cause = getattr(value, '__cause__', None)
+            if cause is not None:
+                message = _causeMessage
+            else:
+                cause = getattr(value, '__context__', None)
+                message = _contextMessage
+                if getattr(value, '__suppress_context__', False):
+                    cause = None
+            if cause is None or id(cause) in seen:
+                break
+            seen.add(id(cause))
+            chain.append((message, type(cause), cause, cause.__traceback__))
+            value = cause
+
+        lines = []
+        for message, typ, value, tb in reversed(chain):
+            lines.extend(self._render(typ, value, tb, limit))
+            if message is not None:
+                lines.extend(('', message, ''))
+        return '\n'.join(lines)
+
+def excinfo(exc_info):
+    """
+    Returns the (type, value, traceback) tuple of an exc_info argument: True for the
+    exception being handled, an exception instance, or a tuple. None if there is no exception.
+    """
+    if isinstance(exc_info, BaseException):
+        return type(exc_info), exc_info, getattr(exc_info, '__traceback__', None)
+    if not isinstance(exc_info, tuple):
+        exc_info = sys.exc_info()
+    if exc_info[0] is None:
+        return None
+    return exc_info
@@ -0,0 +1,129 @@
+# Viewer for indexed fastlog log files, run with `python -m fastlog view`
+import argparse
+import datetime
+import importlib
+import logging
+import os
+import sys
+import time
+
+from . import index
+from .log import Formatter
+
+# Accepted formats of the --since and --until arguments, besides seconds since the epoch
+_timeformats = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+_clockformats = ('%H:%M:%S', '%H:%M')
+
+def parsetime(text):
+    """
+    Parses a point in time given on the command line.
+
+    Either seconds since the epoch, a date with an optional time, or a time of today.
+    Fractions of seconds may follow the seconds.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+
+    text, _, fraction = text.partition('.')
+    fraction = float('0.' + fraction) if fraction else 0.0
+
+    for fmt in _timeformats:
+        try:
+            return time.mktime(datetime.datetime.strptime(text, fmt).timetuple()) + fraction
+        except ValueError:
+            pass
+    for fmt in _clockformats:
+        try:
+            clock = datetime.datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+        today = datetime.datetime.combine(datetime.date.today(), clock)
+        return time.mktime(today.timetuple()) + fraction
+
+    raise argparse.ArgumentTypeError("%s is not a valid time" % text)
+
+def parselevel(text):
+    """
+    Parses a level given by name or number
+    """
+    if text.isdigit():
+        return int(text)
+    level = logging.getLevelName(text.upper())
+    if not isinstance(level, int):
+        raise argparse.ArgumentTypeError("%s is not a valid level" % text)
+    return level
+
+class Recolor(object):
+    """
+    Swaps the plain prefixes of records written by an uncolored formatter for the
+    colored prefixes of the same style
+    """
+
+    def __init__(self, style):
+        self.plain = Formatter(style, color=False).compiled
+        self.color = Formatter(style).compiled
+
+    def __call__(self, text, msgtype, indentLevel):
+        if msgtype is None or msgtype in ('newline', 'indented', 'animated', 'table'):
+            return text
+
+        plain = self.plain.render(msgtype, '', indentLevel)
+
+        # Only the first line carries the prefix. It may follow a timestamp.
+        end = text.find('\n')
+        at = text.find(plain, 0, len(text) if end < 0 else end)
+        if at < 0:
+            return text
+        return text[:at] + self.color.render(msgtype, '', indentLevel) + text[at + len(plain):]
+
+def view(args, out=None):
+    """
+    Prints the records of an indexed log file matching the command line arguments
+    """
+    out = out or sys.stdout
+    if not os.path.exists(index.paths(args.file)[0]):
+        sys.stderr.write("%s has no index, it must be written by IndexedFileHandler\n" % args.file)
+        return 1
+    reader = index.IndexReader(args.file)
+
+    types = None
+    if args.type:
+        types = [index.typecode(t) for t in args.type]
+
+    recolor = None
+    if args.color == 'always' or (args.color == 'auto' and out.isatty()):
+        recolor = Recolor(importlib.import_module(args.style))
+
+    shown = 0
+    with open(args.file, 'rb') as f:
+        for offset, length, created, levelno, code, indent in reader.find(args.since, args.until, args.level, types):
+            if args.limit is not None and shown >= args.limit:
+                break
+            f.seek(offset)
+            text = f.read(length).decode(args.encoding, 'replace')
+            if recolor is not None:
+                text = recolor(text, index.typename(code), indent)
+            out.write(text)
+            shown += 1
+    return 0
+
+def configure(parser):
+    """
+    Adds the arguments of the view command to an argument parser
+    """
+    parser.add_argument('file', help='log file written by fastlog.handlers.IndexedFileHandler')
+    parser.add_argument('--since', type=parsetime, help='skip records before this time')
+    parser.add_argument('--until', type=parsetime, help='skip records after this time')
+    parser.add_argument('--level', type=parselevel, default=logging.NOTSET,
+                        help='skip records below this level, eg. ERROR')
+    parser.add_argument('--errors', dest='level', action='store_const', const=logging.ERROR,
+                        help='only show errors, same as --level ERROR')
+    parser.add_argument('--type', action='append', choices=index.TYPES,
+                        help='only show records of this type, may be repeated')
+    parser.add_argument('--limit', type=int, help='stop after this many records')
+    parser.add_argument('--style', default='fastlog.styles.pwntools', help='style used to color the records')
+    parser.add_argument('--color', choices=('auto', 'always', 'never'), default='auto')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.set_defaults(func=view)
@@ -0,0 +1,4 @@
+import os
+
+# fastlog's termcap lookups need a terminal description, even when the tests are not run on a tty
+os.environ.setdefault('TERM', 'xterm')
@@ -0,0 +1,67 @@
+import os
+import socket
+
+import pytest
+
+from fastlog import log
+from fastlog.control import Control, ControlError
+
+
+def test_commands_apply_at_once():
+    control = Control(log)
+    udp = log.getChild('ctl.udp')
+    try:
+        with pytest.raises(ControlError):
+            control.execute('debug ctl.udp\nlevel nonsense')
+        assert not udp.isEnabledFor(log.DEBUG)
+
+        assert control.execute('# comment\ndebug ctl.udp\nlevel WARNING\nlevels')[:1] == ['fastlog WARNING']
+        assert udp.isEnabledFor(log.DEBUG) and not log.isEnabledFor(log.INFO)
+
+        control._step(-1)
+        assert log.getEffectiveLevel() == log.INFO
+    finally:
+        control.execute('level ctl.udp NOTSET\nlevel INFO')
+
+
+def test_control_socket(tmp_path):
+    path = str(tmp_path / 'control.sock')
+    control = Control(log)
+    control.listen(path)
+    try:
+        client = socket.socket(socket.AF_UNIX)
+        client.connect(path)
+        client.sendall(b'level ctl DEBUG\nbogus\n')
+        client.shutdown(socket.SHUT_WR)
+        reply = b''
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            reply += data
+        client.close()
+    finally:
+        control.close()
+        log.getChild('ctl').setLevel(log.NOTSET)
+    assert reply.decode('utf-8').splitlines() == ['ok', 'error: Invalid command: bogus']
+    assert not os.path.exists(path)
+
+
+def test_control_socket_replaces_only_sockets(tmp_path):
+    path = str(tmp_path / 'control.sock')
+    with open(path, 'w') as f:
+        f.write('keep')
+    with pytest.raises(ControlError):
+        Control(log).listen(path)
+    with open(path) as f:
+        assert f.read() == 'keep'
+    os.unlink(path)
+
+    # A socket left behind by a crashed process
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    control = Control(log)
+    control.listen(path)
+    control.close()
+    assert not os.path.exists(path)
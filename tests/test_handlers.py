@@ -0,0 +1,208 @@
+import json
+import logging
+import mmap
+import os
+import socket
+import threading
+
+from fastlog import log
+from fastlog.backpressure import BoundedQueue
+from fastlog.handlers import AsyncHandler, IndexedFileHandler, MmapFileHandler, NetworkHandler, SyslogHandler
+from fastlog.index import IndexReader
+
+
+def serve_tcp(server, received):
+    conn, _ = server.accept()
+    with conn:
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                return
+            received.append(data)
+
+
+def test_network_handler_tcp():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    received = []
+    thread = threading.Thread(target=serve_tcp, args=(server, received))
+    thread.start()
+
+    handler = NetworkHandler('127.0.0.1', server.getsockname()[1])
+    log.addHandler(handler)
+    try:
+        log.info('hello %s', 'tcp')
+        with log.indent():
+            log.warning('nested')
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+    thread.join(5)
+    server.close()
+
+    lines = [json.loads(line) for line in b''.join(received).splitlines()]
+    assert [(l['type'], l['indent'], l['msg']) for l in lines] == [('info', 0, 'hello tcp'), ('warning', 1, 'nested')]
+
+
+def test_syslog_handler_udp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+
+    handler = SyslogHandler('127.0.0.1', server.getsockname()[1])
+    log.addHandler(handler)
+    try:
+        log.error('broken "thing"')
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    msg = server.recv(65536).decode('utf-8')
+    server.close()
+    assert msg.startswith('<11>1 ')
+    assert msg.endswith('[fastlog@32473 type="error" indent="0"] broken "thing"')
+
+    # Forked workers send their own process ID
+    handler.procid = '1'
+    handler.afterFork()
+    assert handler.procid == str(os.getpid())
+
+
+def test_network_handler_drops_oversized_datagrams():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+
+    handler = NetworkHandler('127.0.0.1', server.getsockname()[1], transport='udp')
+    log.addHandler(handler)
+    try:
+        log.info('x' * 70000)
+        log.info('small')
+        handler.flush()
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    received = json.loads(server.recv(65536).decode('utf-8'))
+    server.close()
+    assert received['msg'] == 'small'
+    assert handler.queue.stats['oversized'] == 1 and len(handler.queue) == 0
+
+
+def test_backpressure_policies():
+    queue = BoundedQueue(4, policy='drop_level', dropLevel=logging.INFO, highWater=0.5)
+    for i in range(2):
+        assert queue.put(i, logging.DEBUG)
+    assert not queue.put('debug', logging.DEBUG)
+    assert queue.put('info', logging.INFO)
+    assert queue.stats['level'] == 1
+    assert 'dropped 1 records (level: 1)' in queue.summary(force=True)
+    assert queue.summary(force=True) is None
+
+    queue = BoundedQueue(2, policy='drop_oldest')
+    for i in range(3):
+        queue.put(i)
+    assert queue.get(10) == [1, 2] and queue.dropped == 1
+
+    queue = BoundedQueue(1, policy='drop_newest')
+    assert queue.put(0) and not queue.put(1)
+
+    # Taken items are unfinished until done, so flush() waits for them
+    assert queue.get(10) == [0] and len(queue) == 0
+    assert queue.unfinished == 1
+    queue.done(1)
+    assert queue.unfinished == 0
+
+
+def test_async_handler():
+    records = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(self.format(record))
+
+    handler = AsyncHandler(Capture())
+    log.addHandler(handler)
+    try:
+        log.info('hello %s', 'async')
+        handler.flush()
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+    assert records == ['[*] hello async']
+
+
+def test_mmap_file_handler(tmp_path):
+    path = str(tmp_path / 'trace.log')
+    handler = MmapFileHandler(path, extent=mmap.ALLOCATIONGRANULARITY, index=True)
+    log.addHandler(handler)
+    try:
+        log.info('first')
+        log.info_many(['x' * 100] * (mmap.ALLOCATIONGRANULARITY // 50))
+        # Readable while open, followed by the unused part of the extent
+        with open(path, 'rb') as f:
+            assert f.read(10) == b'[*] first\n'
+        assert os.path.getsize(path) > handler.offset
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    size = os.path.getsize(path)
+    assert size == handler.offset == 10 + (mmap.ALLOCATIONGRANULARITY // 50) * 105
+
+    # Reopening continues after the last record, even if the file wasn't cut down
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 100)
+    handler = MmapFileHandler(path)
+    assert handler.offset == size
+    handler.close()
+    assert list(IndexReader(path).find())[-1][:2] == (size - 105, 105)
+
+
+def test_fork_reopens_sinks(tmp_path):
+    if not hasattr(os, 'register_at_fork'):
+        return
+    path = str(tmp_path / 'worker.log')
+    handler = MmapFileHandler(path, extent=mmap.ALLOCATIONGRANULARITY, index=True)
+    target = MmapFileHandler(str(tmp_path / 'async.log'), extent=mmap.ALLOCATIONGRANULARITY)
+    queued = AsyncHandler(target)
+    shared = IndexedFileHandler(str(tmp_path / 'shared.log'), index=False)
+    split = IndexedFileHandler(str(tmp_path / 'split.log'), index=False, perProcess=True)
+    sinks = [handler, queued, shared, split]
+    for sink in sinks:
+        log.addHandler(sink)
+    try:
+        log.info('parent')
+        queued.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                log.info('child')
+                queued.flush()
+                status = 0
+            finally:
+                os._exit(status)
+        assert os.waitpid(pid, 0)[1] == 0
+        log.info('parent again')
+    finally:
+        for sink in sinks:
+            log.removeHandler(sink)
+            sink.close()
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'[*] parent\n[*] parent again\n'
+    # Index entries buffered before the fork are written by the parent only
+    assert [entry[:2] for entry in IndexReader(path).find()] == [(0, 11), (11, 17)]
+    with open('%s.%d' % (path, pid), 'rb') as f:
+        assert f.read().rstrip(b'\0') == b'[*] child\n'
+    with open('%s.%d' % (tmp_path / 'async.log', pid), 'rb') as f:
+        assert f.read().rstrip(b'\0') == b'[*] child\n'
+
+    # Unindexed appended files are shared unless asked otherwise
+    with open(str(tmp_path / 'shared.log'), 'rb') as f:
+        assert f.read() == b'[*] parent\n[*] child\n[*] parent again\n'
+    assert not os.path.exists('%s.%d' % (tmp_path / 'shared.log', pid))
+    with open('%s.%d' % (tmp_path / 'split.log', pid), 'rb') as f:
+        assert f.read() == b'[*] child\n'
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import array
+import io
+
+from fastlog import log, hexdump
+
+
+def test_buffer_types_match_legacy_list():
+    expected = hexdump.hexdump(log, list(map(chr, range(256))))
+    data = bytes(bytearray(range(256)))
+    assert hexdump.hexdump(log, data) == expected
+    assert hexdump.hexdump(log, bytearray(data)) == expected
+    assert hexdump.hexdump(log, memoryview(data)) == expected
+    assert hexdump.hexdump(log, array.array('B', data)) == expected
+    assert '\n'.join(hexdump.hexdump_iter(log, io.BytesIO(data))) == expected
+
+
+def test_flat_views_without_copy():
+    data = bytearray(b'abcd')
+    view = hexdump._flat(data)
+    data[0] = ord('z')
+    assert view[0] == ord('z')
+
+
+def test_wide_buffers_are_cast_to_bytes():
+    view = hexdump._flat(array.array('H', [0x4142]))
+    assert view.tobytes() in (b'\x42\x41', b'\x41\x42')
+
+
+def test_highlight_patterns_and_ranges():
+    data = b'\x00' * 14 + b'\xde\xad\xbe\xef' + b'\x00' * 30
+    highlight = [b'\xde\xad\xbe\xef', (40, 2, None)]
+    lines = list(hexdump.hexdump_iter(log, data, highlight=highlight))
+
+    # Patterns crossing rows are found in streamed data too
+    assert list(hexdump.hexdump_iter(log, io.BytesIO(data), highlight=highlight)) == lines
+
+    marked = log.style.hexdump['highlight']('de')
+    assert marked in lines[0] + lines[1]
+    assert log.style.hexdump['highlight']('00') in lines[2]
+    assert len(lines) == 4
+
+    # The style of a range is optional
+    assert list(hexdump.hexdump_iter(log, data, highlight=[b'\xde\xad\xbe\xef', (40, 2)])) == lines
+
+
+def test_hexdump_cache():
+    records = []
+    log.setHexdumpCache(4096)
+    try:
+        log.inner.addFilter(records.append)
+        data = bytearray(range(64))
+        log.hexdump(data, level=log.INFO)
+        log.hexdump(memoryview(bytes(data)), level=log.INFO)
+        log.hexdump(data, level=log.INFO, batch=2)
+        log.hexdump(data, level=log.INFO, width=8)
+        cache = log._hexcache
+        assert (cache.hits, cache.misses, len(cache)) == (2, 2, 2)
+
+        # Generators of highlights are read once, for the key and the rendering
+        log.hexdump(data, level=log.INFO, highlight=(b for b in [b'\x01\x02']))
+        assert log.style.hexdump['highlight']('01') in records[-1].getMessage()
+
+        # Evicted once over the limit
+        log.hexdump(bytes(bytearray(range(256))) * 4, level=log.INFO)
+        assert cache.size <= 4096
+    finally:
+        log.inner.removeFilter(records.append)
+        log.setHexdumpCache(None)
+    assert records[0].getMessage() == records[1].getMessage() == '\n'.join(r.getMessage() for r in records[2:5])
+
+
+def test_streamed_highlight_longer_than_a_row():
+    data = bytes(bytearray(range(7, 100)))
+    # Starts on the first row, before a whole pattern length has been read
+    highlight = [data[2:31]]
+    lines = list(hexdump.hexdump_iter(log, data, highlight=highlight))
+    assert list(hexdump.hexdump_iter(log, io.BytesIO(data), highlight=highlight)) == lines
+    assert lines != list(hexdump.hexdump_iter(log, data))
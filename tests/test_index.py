@@ -0,0 +1,63 @@
+import logging
+
+from fastlog import log, index
+from fastlog.handlers import IndexedFileHandler
+
+
+def test_indexed_file_lookup(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, 'BUCKET_SIZE', 8)
+    filename = str(tmp_path / 'test.log')
+    handler = IndexedFileHandler(filename)
+    log.addHandler(handler)
+    try:
+        for i in range(50):
+            log.info('record %d', i)
+            if i % 10 == 0:
+                log.error('failed %d', i)
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    reader = index.IndexReader(filename)
+    assert reader.entryCount == 55
+    assert len(reader.buckets) == 6
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+    errors = [data[e[0]:e[0] + e[1]] for e in reader.find(minlevel=logging.ERROR)]
+    assert errors == [('[ERROR] failed %d\n' % i).encode() for i in range(0, 50, 10)]
+
+    infos = list(reader.find(types=[index.typecode('info')]))
+    assert len(infos) == 50
+    assert list(reader.find(since=infos[-1][2] + 1)) == []
+
+
+def test_rewritten_log_starts_a_new_index(tmp_path):
+    filename = str(tmp_path / 'test.log')
+    for run in range(2):
+        handler = IndexedFileHandler(filename, mode='w')
+        log.addHandler(handler)
+        try:
+            log.info('run %d', run)
+        finally:
+            log.removeHandler(handler)
+            handler.close()
+    assert [e[:2] for e in index.IndexReader(filename).find()] == [(0, 10)]
+
+
+def test_view_command(tmp_path, capsys):
+    from fastlog.__main__ import main
+    filename = str(tmp_path / 'test.log')
+    handler = IndexedFileHandler(filename)
+    log.addHandler(handler)
+    try:
+        log.info('started')
+        log.error('broken')
+        log.critical('gone')
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+    capsys.readouterr()
+
+    assert main(['view', filename, '--errors', '--type', 'error', '--color', 'never']) == 0
+    assert capsys.readouterr().out == '[ERROR] broken\n'
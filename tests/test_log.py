@@ -0,0 +1,370 @@
+import io
+import logging
+
+import pytest
+
+from fastlog import log, hexdump
+from fastlog.log import Formatter, _escapes
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def sinks():
+    added = []
+
+    def add(handler):
+        log.addHandler(handler)
+        added.append(handler)
+        return handler
+    yield add
+    for handler in added:
+        log.removeHandler(handler)
+
+
+class CountingFormatter(Formatter):
+    calls = 0
+
+    def format(self, record):
+        CountingFormatter.calls += 1
+        return super(CountingFormatter, self).format(record)
+
+
+def test_streamed_hexdump_batches(sinks):
+    handler = sinks(Capture())
+    data = bytes(bytearray(range(256)))
+    log.hexdump(data, batch=4, level=log.INFO)
+    msgs = [r.getMessage() for r in handler.records]
+    assert len(msgs) == 5
+    assert '\n'.join(msgs) == hexdump.hexdump(log, data)
+    assert all(getattr(r, 'fastlog-type') == 'indented' for r in handler.records)
+
+    # Every batch gets its own extra fields, timed when it is logged
+    extra = {'tag': 1}
+    log.hexdump(data, batch=4, level=log.INFO, extra=extra)
+    assert extra == {'tag': 1}
+    batches = handler.records[5:]
+    assert len(batches) == 5 and all(r.tag == 1 for r in batches)
+
+
+def test_records_formatted_once_per_formatter(sinks):
+    formatter = CountingFormatter(log.style, color=False)
+    streams = [io.StringIO(), io.StringIO()]
+    for stream in streams:
+        sinks(logging.StreamHandler(stream)).setFormatter(formatter)
+
+    CountingFormatter.calls = 0
+    log.info('hello %s', 'world')
+    assert CountingFormatter.calls == 1
+    assert streams[0].getvalue() == streams[1].getvalue() == '[*] hello world\n'
+
+
+def test_handler_subclasses_keep_their_emit(sinks, tmp_path):
+    import logging.handlers
+    path = str(tmp_path / 'rotating.log')
+    handler = sinks(logging.handlers.RotatingFileHandler(path, maxBytes=50, backupCount=2))
+    handler.setFormatter(Formatter(log.style, color=False))
+    try:
+        for i in range(3):
+            log.info('record %d padded to rotate the file', i)
+        log.setMode('native')
+        log.info_many(['native record padded to rotate the file'] * 2)
+    finally:
+        log.setMode('logging')
+        handler.close()
+    with open(path) as f:
+        assert f.read() == '[*] native record padded to rotate the file\n'
+    with open(path + '.2') as f:
+        assert f.read() == '[*] record 2 padded to rotate the file\n'
+
+
+def test_set_style_replaces_console():
+    count = len(log._handlers)
+    log.setStyle('fastlog.styles.pwntools')
+    assert len(log._handlers) == count
+
+
+def test_compiled_style_renders_custom_styles():
+    import types
+    from fastlog.compiler import compile_style
+    from fastlog.styles import pwntools
+
+    style = types.ModuleType('custom')
+    style.indent = '  '
+    style.prefixes = {'info': [lambda s: '<%s>' % s, 'i']}
+    style.separator = [lambda s: s, '=' * 3]
+    style.hexdump = pwntools.hexdump
+
+    compiled = compile_style(style)
+    assert compiled.render('info', 'a\nb', 1) == '  [<i>] a\n  b'
+    assert compiled.render('separator', '', 2) == '    ==='
+    assert compiled.render('unknown', 'x', 0) == '[?] x'
+    assert compile_style(style, color=False).render('info', 'a', 0) == '[i] a'
+
+
+def test_timestamp_caches_seconds():
+    import time
+    from fastlog.timestamp import Timestamp
+
+    now = float(int(time.time()))
+    stamp = Timestamp('ms', suffix='')
+    assert stamp(now + 0.25).endswith('.250')
+    assert stamp(now + 0.5).endswith('.500')
+    assert stamp(now + 0.5)[:-4] == time.strftime('%H:%M:%S', time.localtime(now))
+    assert Timestamp('delta', start=10.0, suffix='')(now, 11.5).strip() == '1.500000'
+    # Records without a monotonic time are placed by their wall clock time
+    delta = Timestamp('delta', suffix='')
+    assert 0.9 < float(delta(time.time() + 1)) < 1.1
+
+
+def test_callsite_points_at_caller(sinks):
+    handler = sinks(Capture())
+    log.setCallsite()
+    try:
+        log.info('here')
+        line = test_callsite_points_at_caller.__code__.co_firstlineno + 4
+        # Direct calls to the inner logger look their caller up
+        logging.getLogger('fastlog').info('direct')
+    finally:
+        log.setCallsite(False)
+    record, direct = handler.records[-2:]
+    assert (record.filename, record.lineno, record.funcName) == ('test_log.py', line, 'test_callsite_points_at_caller')
+    assert getattr(record, 'fastlog-callsite') == 'test_log.py:%d:test_callsite_points_at_caller' % line
+    assert (direct.filename, direct.lineno) == ('test_log.py', line + 3)
+
+
+def test_bound_context(sinks):
+    handler = sinks(Capture())
+    conn = log.bind(conn_id=3)
+    peer = conn.bind(peer='10.0.0.1')
+    with peer.indent():
+        peer.info('connected')
+    log.info('unbound')
+
+    bound, unbound = handler.records[-2:]
+    assert getattr(bound, 'fastlog-fields') == {'conn_id': 3, 'peer': '10.0.0.1'}
+    assert handler.formatter.format(bound) == '    [*] conn_id=3 peer=10.0.0.1 connected'
+    assert handler.formatter.format(unbound) == '[*] unbound'
+    assert log._indent == 0
+
+
+def test_timed_blocks(sinks):
+    handler = sinks(Capture())
+    with log.timed('parse'):
+        log.info('inside')
+    with pytest.raises(ValueError):
+        with log.timed('parse'):
+            raise ValueError()
+
+    inside, ok, failed = handler.records[-3:]
+    assert getattr(inside, 'fastlog-indent') == 1
+    assert getattr(ok, 'fastlog-type') == 'success' and ok.getMessage().startswith('parse took ')
+    assert getattr(failed, 'fastlog-type') == 'failure' and failed.getMessage().endswith('(ValueError)')
+
+    t = log._timings.labels['parse']
+    assert (t.count, t.failures) == (2, 1)
+    assert t.min <= t.percentile(50) <= t.max
+
+    log.timings(reset=True)
+    table = [handler.formatter.format(r) for r in handler.records[-3:]]
+    assert table[0].split()[:3] == ['label', 'count', 'failed']
+    assert table[2].split()[:3] == ['parse', '2', '1']
+    assert not log._timings.labels
+
+
+def test_timing_buckets():
+    from fastlog.timing import bucket, bucketRange
+    for ns in (0, 7, 15, 16, 100, 12345, 10 ** 9):
+        low, high = bucketRange(bucket(ns))
+        assert low <= ns <= high and high - low <= ns // 8
+
+
+def test_exception_traceback(sinks):
+    handler = sinks(Capture())
+
+    def inner():
+        raise ValueError('bad value')
+
+    def outer():
+        inner()
+
+    try:
+        outer()
+    except ValueError:
+        log.exception('failed %d', 1, exc_info=True, limit=1)
+
+    lines = handler.formatter.format(handler.records[-1]).splitlines()
+    assert lines[0] == '[ERROR] failed 1'
+    assert lines[1:3] == ['    Traceback (most recent call last):', '      ... 2 frames hidden']
+    assert lines[3].endswith('in inner')
+    assert lines[4].strip() == "raise ValueError('bad value')"
+    assert lines[5] == '    ValueError: bad value'
+    assert len(lines) == 6
+
+
+def test_native_mode(sinks):
+    handler = sinks(Capture())
+    handler.nativeRecords = True
+    stream = io.StringIO()
+    foreign = sinks(logging.StreamHandler(stream))
+    foreign.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+
+    conn = log.bind(conn_id=1)
+    log.setMode('native')
+    try:
+        with conn.indent():
+            conn.warning('native %d', 1)
+    finally:
+        log.setMode('logging')
+    conn.warning('native %d', 1)
+
+    native, standard = handler.records[-2:]
+    assert not isinstance(native, logging.LogRecord)
+    assert isinstance(standard, logging.LogRecord)
+    assert handler.formatter.format(native) == '    ' + handler.formatter.format(standard)
+    assert getattr(native, 'fastlog-fields') == {'conn_id': 1}
+    assert stream.getvalue() == 'WARNING native 1\nWARNING native 1\n'
+
+
+class BrokenFormatter(logging.Formatter):
+    def format(self, record):
+        raise ValueError('broken')
+
+
+class ErrorHandler(logging.StreamHandler):
+    def __init__(self):
+        logging.StreamHandler.__init__(self, io.StringIO())
+        self.setFormatter(BrokenFormatter())
+        self.errors = []
+
+    def handleError(self, record):
+        self.errors.append(record)
+
+
+def test_native_mode_errors_and_unicode(sinks):
+    handler = sinks(Capture())
+    handler.nativeRecords = True
+    broken = sinks(ErrorHandler())
+    log.setMode('native')
+    try:
+        log.info(u'caf\xe9 \u2500')
+        log.info_many([u'\u2026'] * 2)
+    finally:
+        log.setMode('logging')
+    assert [r.getMessage() for r in handler.records] == [u'caf\xe9 \u2500', u'\u2026', u'\u2026']
+    # Error handlers may read any LogRecord attribute
+    assert all(isinstance(r, logging.LogRecord) for r in broken.errors)
+    assert len(broken.errors) == 3
+
+
+class CountingStream(io.StringIO):
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return io.StringIO.write(self, text)
+
+
+def test_batches_write_once(sinks):
+    stream = CountingStream()
+    sinks(logging.StreamHandler(stream))
+    handler = sinks(Capture())
+
+    log.info_many('entry %d' % i for i in range(3))
+    with log.batch():
+        log.info('first')
+        with log.indent():
+            log.warning('second %s', 'nested')
+        with log.batch():
+            log.debug('hidden')
+        assert stream.writes == 1
+
+    assert stream.writes == 2
+    assert stream.getvalue().splitlines() == ['[*] entry 0', '[*] entry 1', '[*] entry 2',
+                                              '[*] first', '    [!] second nested']
+    assert [r.getMessage() for r in handler.records[-5:]] == ['entry 0', 'entry 1', 'entry 2',
+                                                              'first', 'second nested']
+
+
+def test_table_streams_rows(sinks):
+    handler = sinks(Capture())
+    rows = ({'name': 'row%d' % i, 'size': 10 ** i} for i in range(5))
+    with log.indent():
+        log.table(rows, columns=['name', 'size'], sample=2, batch=2, level=log.INFO)
+
+    lines = [handler.formatter.format(r) for r in handler.records[-7:]]
+    assert lines[:3] == ['        name  size', u'        \u2500\u2500\u2500\u2500  \u2500\u2500\u2500\u2500',
+                         '        row0     1']
+    # Widths come from the sample, later cells are cut short
+    assert lines[-1] == u'        row4  100\u2026'
+
+    count = len(handler.records)
+    with pytest.raises(ValueError):
+        log.table([(1, 2)], columns=['x', 'y'], align='<', level=log.INFO)
+    assert len(handler.records) == count
+
+
+def test_child_loggers(sinks):
+    import fastlog
+    root = sinks(Capture())
+    tcp = fastlog.getLogger('proto.tcp')
+    assert tcp is log.getChild('proto').getChild('tcp')
+    assert tcp.inner.name == 'fastlog.proto.tcp'
+
+    subtree = Capture()
+    tcp.addHandler(subtree)
+    try:
+        tcp.debug('hidden')
+        fastlog.getLogger('proto').setLevel(log.DEBUG)
+        assert tcp.isEnabledFor(log.DEBUG) and not log.isEnabledFor(log.DEBUG)
+        tcp.debug('shown')
+        log.setMode('native')
+        tcp.setMode('native')
+        tcp.debug('native')
+    finally:
+        log.setMode('logging')
+        tcp.setMode('logging')
+        tcp.removeHandler(subtree)
+        fastlog.getLogger('proto').setLevel(log.NOTSET)
+
+    assert [r.getMessage() for r in subtree.records] == ['shown', 'native']
+    assert [r.getMessage() for r in root.records[-2:]] == ['shown', 'native']
+    assert not tcp.isEnabledFor(log.DEBUG)
+
+
+def test_collapse_repeats(monkeypatch):
+    import fastlog
+    stream = io.StringIO()
+    monkeypatch.setattr('sys.stdout', stream)
+    log.setCollapse(timeout=60)
+    try:
+        for _ in range(3):
+            log.info('retrying')
+        with log.indent():
+            log.info_many(['polling'] * 4)
+        log.info('done')
+        log.info('done')
+        # Rendered differently, never collapsed
+        log.bind(conn=1).info('ok')
+        log.bind(conn=2).info('ok')
+    finally:
+        log.setCollapse(False)
+    assert _escapes.sub('', stream.getvalue()).splitlines() == [
+        '[*] retrying', '    ... repeated 2 times',
+        '    [*] polling', '        ... repeated 3 times',
+        '[*] done', '    ... repeated 1 times',
+        '[*] conn=1 ok', '[*] conn=2 ok']
+
+    # Child loggers share the console of the top-level logger
+    fastlog.getLogger('collapse').setCollapse(timeout=60)
+    try:
+        assert log._console.collapseTimeout == 60
+    finally:
+        log.setCollapse(False)